@@ -1,17 +1,33 @@
 import os
 import re
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Callable
 
 import cv2
 import numpy as np
 import pytesseract
 
+# YOLO models are loaded/cached/batched by the shared registry (repo root carid/)
+from carid import yolo_registry
+
 # If uvicorn can't find tesseract.exe, uncomment:
 # pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
 # US-like plate heuristic: 5–8 chars, alphanumeric, must include a digit
 PLATE_REGEX = re.compile(r"^[A-Z0-9]{5,8}$")
 
+# Cascade mode: find vehicles first (carid.detector), then look for plates only
+# in the lower part of each vehicle box instead of the whole frame.
+CASCADE = os.getenv("ALPR_CASCADE", "0").strip().lower() in ("1", "true", "yes")
+CASCADE_MAX_VEHICLES = 6     # largest vehicles only
+CASCADE_PER_VEHICLE = 2      # plate candidates OCR'd per vehicle
+CASCADE_ROI_TOP = 0.4        # ROI = vehicle box from 40% of its height down
+CASCADE_ROI_WIDTH = (320, 960)  # ROIs are rescaled into this width range
+
+# candidate boxes overlapping a better one by more than this IoU, or lying
+# mostly inside it (intersection / smaller box area), are not OCR'd
+NMS_IOU = 0.3
+NMS_CONTAIN = 0.7
+
 # ----------------------------- OCR helpers -----------------------------
 def _ocr_plate(crop_bgr: np.ndarray) -> str:
     gray = cv2.cvtColor(crop_bgr, cv2.COLOR_BGR2GRAY)
@@ -47,72 +63,106 @@ def _preprocess(img: np.ndarray) -> np.ndarray:
     closed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel, iterations=2)
     return closed
 
-def _candidate_boxes(img: np.ndarray) -> List[Tuple[int,int,int,int]]:
+def _nms(boxes: np.ndarray, iou_thr: float = NMS_IOU, contain_thr: float = NMS_CONTAIN) -> np.ndarray:
+    """
+    Greedy non-max suppression over (N,4) [x,y,w,h] boxes that are already
+    sorted best-first. A box is also suppressed when it mostly lies inside a
+    kept one (e.g. a character blob inside its plate), which IoU alone misses.
+    Returns the indices to keep, in order.
+    """
+    if len(boxes) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    b = boxes.astype(np.float64)
+    x0, y0 = b[:, 0], b[:, 1]
+    x1, y1 = x0 + b[:, 2], y0 + b[:, 3]
+    areas = b[:, 2] * b[:, 3]
+    order = np.arange(len(b))
+    keep = []
+    while order.size:
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        iw = np.clip(np.minimum(x1[i], x1[rest]) - np.maximum(x0[i], x0[rest]), 0, None)
+        ih = np.clip(np.minimum(y1[i], y1[rest]) - np.maximum(y0[i], y0[rest]), 0, None)
+        inter = iw * ih
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        contain = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        order = rest[(iou <= iou_thr) & (contain <= contain_thr)]
+    return np.asarray(keep, dtype=np.int64)
+
+def _centre_inside(mask: Optional[np.ndarray], boxes: np.ndarray) -> np.ndarray:
+    """Which (N,4) [x,y,w,h] boxes have their centre on a nonzero pixel of `mask` (all if no mask)."""
+    if mask is None or len(boxes) == 0:
+        return np.ones((len(boxes),), dtype=bool)
+    cx = np.clip(boxes[:, 0] + boxes[:, 2] // 2, 0, mask.shape[1] - 1)
+    cy = np.clip(boxes[:, 1] + boxes[:, 3] // 2, 0, mask.shape[0] - 1)
+    return mask[cy, cx] > 0
+
+def _bounding_rects(contours) -> np.ndarray:
+    """(N,4) [x,y,w,h] per contour, same as cv2.boundingRect, from one pass over all points."""
+    if not len(contours):
+        return np.zeros((0, 4), dtype=np.int64)
+    counts = np.fromiter(map(len, contours), dtype=np.int64, count=len(contours))
+    pts = np.concatenate(contours).reshape(-1, 2)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    lo = np.minimum.reduceat(pts, starts, axis=0)
+    hi = np.maximum.reduceat(pts, starts, axis=0)
+    return np.concatenate([lo, hi - lo + 1], axis=1).astype(np.int64)
+
+def _candidate_boxes(
+    img: np.ndarray, fallback_full: bool = True, mask: Optional[np.ndarray] = None
+) -> List[Tuple[int,int,int,int]]:
     closed = _preprocess(img)
-    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     H, W = img.shape[:2]
-    boxes: List[Tuple[int,int,int,int]] = []
-    for c in contours:
-        x, y, w, h = cv2.boundingRect(c)
-        area = w * h
-        if area < (W * H) * 0.004:
-            continue
-        ar = w / float(h) if h else 0
-        if ar < 1.5 or ar > 7.0:
-            continue
-        pad_x = int(w * 0.08)
-        pad_y = int(h * 0.20)
-        x0 = max(0, x - pad_x)
-        y0 = max(0, y - pad_y)
-        x1 = min(W, x + w + pad_x)
-        y1 = min(H, y + h + pad_y)
-        boxes.append((x0, y0, x1 - x0, y1 - y0))
-
-    if not boxes:
-        boxes = [(0, 0, W, H)]
-    cx, cy = W / 2, H / 2
-    boxes.sort(key=lambda b: (-(b[2]*b[3]), ((b[0]+b[2]/2-cx)**2+(b[1]+b[3]/2-cy)**2)**0.5))
-    return boxes[:5]
-
-def _detect_with_opencv(img: np.ndarray):
-    boxes = _candidate_boxes(img)
+    # outer blobs only: blobs nested inside a plate (characters, border) would
+    # each cost an OCR run
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    st = _bounding_rects(contours)
+    x, y, w, h = st[:, 0], st[:, 1], st[:, 2], st[:, 3]
+    ar = w / np.maximum(h, 1).astype(np.float64)
+    keep = (w * h >= (W * H) * 0.004) & (ar >= 1.5) & (ar <= 7.0) & _centre_inside(mask, st)
+    x, y, w, h = x[keep], y[keep], w[keep], h[keep]
+
+    if not len(x):
+        return [(0, 0, W, H)] if fallback_full else []
+
+    pad_x = (w * 0.08).astype(np.int64)
+    pad_y = (h * 0.20).astype(np.int64)
+    x0 = np.maximum(0, x - pad_x)
+    y0 = np.maximum(0, y - pad_y)
+    x1 = np.minimum(W, x + w + pad_x)
+    y1 = np.minimum(H, y + h + pad_y)
+    boxes = np.stack([x0, y0, x1 - x0, y1 - y0], axis=1)
+
+    # biggest first, ties broken by distance to the image centre (squared: same order)
+    dist2 = (x0 + boxes[:, 2] / 2 - W / 2) ** 2 + (y0 + boxes[:, 3] / 2 - H / 2) ** 2
+    boxes = boxes[np.lexsort((dist2, -(boxes[:, 2] * boxes[:, 3])))]
+    # the same plate padded/split a few ways would otherwise cost one OCR run each
+    boxes = boxes[_nms(boxes)]
+    return [tuple(int(v) for v in b) for b in boxes[:5]]
+
+def _detect_with_opencv(img: np.ndarray, fallback_full: bool = True, mask: Optional[np.ndarray] = None):
+    boxes = _candidate_boxes(img, fallback_full=fallback_full, mask=mask)
     return [(x, y, w, h, 0.15) for (x, y, w, h) in boxes]
 
 # ------------------------ YOLO (optional) support -----------------------
-_yolo_model = None
-def _try_load_yolo() -> Optional[object]:
-    global _yolo_model
-    if _yolo_model is not None:
-        return _yolo_model
-
+def _yolo_weights() -> str:
     weights = os.getenv("YOLO_WEIGHTS", "").strip()
     if not weights:
         here = os.path.dirname(__file__)
         local_path = os.path.join(here, "models", "lp-yolov8n.pt")
         if os.path.isfile(local_path):
             weights = local_path
+    return weights
 
-    if not weights or not os.path.isfile(weights):
-        print("[alpr] YOLO weights not provided or file not found. Using OpenCV fallback.")
-        _yolo_model = None
-        return None
-
-    try:
-        from ultralytics import YOLO
-        _yolo_model = YOLO(weights)
-        print(f"[alpr] YOLO loaded: {weights}")
-        return _yolo_model
-    except Exception as e:
-        print(f"[alpr] Failed to load YOLO weights '{weights}': {e}")
-        _yolo_model = None
-        return None
+def _try_load_yolo() -> Optional[object]:
+    return yolo_registry.get_model(_yolo_weights(), tag="alpr", require_file=True)
 
 def _detect_with_yolo(img: np.ndarray):
     model = _try_load_yolo()
     if model is None:
         return []
     H, W = img.shape[:2]
-    results = model.predict(source=img, conf=0.25, verbose=False)
+    results = yolo_registry.predict(_yolo_weights(), img, conf=0.25, verbose=False)
     out = []
     for r in results:
         if r.boxes is None:
@@ -126,23 +176,110 @@ def _detect_with_yolo(img: np.ndarray):
             out.append((x1i, y1i, w, h, conf))
     return out
 
-# ------------------------------ entry point -----------------------------
-def recognize_plates_from_image(image_path: str) -> List[Dict]:
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError(f"Could not read image: {image_path}")
+# ---------------------------- cascade helpers ---------------------------
+def _vehicle_roi(img: np.ndarray, vbox: Tuple[int,int,int,int]):
+    """
+    Lower part of a vehicle box, rescaled so its width is within CASCADE_ROI_WIDTH.
+    Returns (roi, x0, y0, scale) where full-frame x = x0 + roi_x / scale.
+    """
+    x, y, w, h = vbox
+    y0 = y + int(h * CASCADE_ROI_TOP)
+    roi = img[y0:y+h, x:x+w]
+    lo, hi = CASCADE_ROI_WIDTH
+    scale = 1.0
+    if w < lo:
+        scale = min(lo / float(w), 3.0)
+    elif w > hi:
+        scale = hi / float(w)
+    if scale != 1.0:
+        interp = cv2.INTER_CUBIC if scale > 1.0 else cv2.INTER_AREA
+        roi = cv2.resize(roi, None, fx=scale, fy=scale, interpolation=interp)
+    return roi, x, y0, scale
 
+def _detect_in_vehicles(img: np.ndarray, vehicles: List[Tuple]) -> List[Tuple]:
+    """
+    Plate boxes found inside vehicle ROIs, as
+    (x, y, w, h, det_conf, crop, vehicle) in full-frame coordinates; `crop` is the
+    (rescaled) ROI crop that gets OCR'd.
+    """
     H, W = img.shape[:2]
-    dets = _detect_with_yolo(img)
-    if not dets:
-        dets = _detect_with_opencv(img)
+    out = []
+    for v in vehicles[:CASCADE_MAX_VEHICLES]:
+        vx, vy, vw, vh = v[:4]
+        if vw < 8 or vh < 8:
+            continue
+        roi, x0, y0, s = _vehicle_roi(img, (vx, vy, vw, vh))
+        dets = _detect_with_yolo(roi) or _detect_with_opencv(roi, fallback_full=False)
+        dets = sorted(dets, key=lambda d: d[4], reverse=True)
+        # don't spend both per-vehicle OCR slots on the same plate
+        if len(dets) > 1:
+            dets = [dets[i] for i in _nms(np.asarray([d[:4] for d in dets]))]
+        dets = dets[:CASCADE_PER_VEHICLE]
+        for (bx, by, bw, bh, conf) in dets:
+            fx, fy = x0 + int(bx / s), y0 + int(by / s)
+            fw, fh = max(1, min(W - fx, int(round(bw / s)))), max(1, min(H - fy, int(round(bh / s))))
+            out.append((fx, fy, fw, fh, conf, roi[by:by+bh, bx:bx+bw], v))
+    return out
+
+def _vehicle_boxes(img: np.ndarray, regions: Optional[List[Tuple]] = None) -> List[Tuple]:
+    # carid lives at the repo root next to alpr/
+    from carid import detector
+    return detector.detect_vehicles(img, regions=regions)
+
+# ------------------------------ entry point -----------------------------
+def recognize_plates(
+    img: np.ndarray,
+    cascade: Optional[bool] = None,
+    vehicles: Optional[List[Tuple]] = None,
+    roi: Optional[Callable[[np.ndarray], List[Tuple]]] = None,
+) -> List[Dict]:
+    """
+    Plate reads for a BGR image.
+    cascade=True (default: ALPR_CASCADE) searches only inside vehicle boxes and
+    adds "vehicle_bbox"/"vehicle_score"/"vehicle_label" to each detection, so
+    re-id can crop the same vehicle. Pass `vehicles` (carid.detector output)
+    to reuse boxes that were already detected. Frames with no vehicle found
+    fall back to the full-frame search.
+    `roi(img)` may return (crop, x0, y0, mask) regions of interest (a fixed
+    camera's lot area); detection then only runs on those crops and keeps
+    boxes centred inside `mask` (None = the whole crop).
+    """
+    H, W = img.shape[:2]
+    cascade = CASCADE if cascade is None else cascade
+    regions = roi(img) if roi is not None else None
+
+    # (x, y, w, h, det_conf, crop, vehicle or None)
+    dets: List[Tuple] = []
+    if cascade:
+        if vehicles is None:
+            vehicles = _vehicle_boxes(img, regions)
+        vehicles = [v for v in vehicles if v[5] != "full"]
+        dets = _detect_in_vehicles(img, vehicles)
+    if not cascade or not vehicles:
+        for (area, x0, y0, mask) in (regions or [(img, 0, 0, None)]):
+            found = _detect_with_yolo(area)
+            if found:
+                inside = _centre_inside(mask, np.asarray([d[:4] for d in found], dtype=np.int64))
+                found = [d for d, ok in zip(found, inside) if ok]
+            found = found or _detect_with_opencv(area, fallback_full=not regions, mask=mask)
+            # OCR reads the unmasked frame, offsets map ROI boxes back to it
+            dets += [(x0 + x, y0 + y, w, h, c, img[y0+y:y0+y+h, x0+x:x0+x+w], None) for (x, y, w, h, c) in found]
+
+    # drop overlapping duplicates (e.g. neighbouring vehicle ROIs) before OCR
+    if len(dets) > 1:
+        dets.sort(key=lambda d: d[4], reverse=True)
+        dets = [dets[i] for i in _nms(np.array([d[:4] for d in dets]))]
 
     candidates: List[Dict] = []
-    for (x, y, w, h, det_conf) in dets:
-        crop = img[y:y+h, x:x+w]
+    for (x, y, w, h, det_conf, crop, vehicle) in dets:
         text = _ocr_plate(crop) or "NO_TEXT"
         conf = 0.7 * _confidence_heuristic(text, (w, h), (W, H)) + 0.3 * float(det_conf)
-        candidates.append({"plate": text, "confidence": round(conf, 2), "bbox": [x, y, w, h]})
+        cand = {"plate": text, "confidence": round(conf, 2), "bbox": [x, y, w, h]}
+        if vehicle is not None:
+            cand["vehicle_bbox"] = [int(v) for v in vehicle[:4]]
+            cand["vehicle_score"] = round(float(vehicle[4]), 3)
+            cand["vehicle_label"] = vehicle[5]
+        candidates.append(cand)
 
     # sort by confidence
     candidates.sort(key=lambda d: d["confidence"], reverse=True)
@@ -164,3 +301,22 @@ def recognize_plates_from_image(image_path: str) -> List[Dict]:
         out.append(c)
 
     return out[:5]
+
+def recognize_plates_from_image(
+    image_path: str,
+    cascade: Optional[bool] = None,
+    roi: Optional[Callable[[np.ndarray], List[Tuple]]] = None,
+    with_size: bool = False,
+):
+    """Decode ``image_path`` and run :func:`recognize_plates` on it.
+
+    With ``with_size=True`` returns ``(detections, (H, W))`` so callers that
+    need the frame size don't decode the image a second time.
+    """
+    img = cv2.imread(image_path)
+    if img is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    dets = recognize_plates(img, cascade=cascade, roi=roi)
+    if with_size:
+        return dets, img.shape[:2]
+    return dets
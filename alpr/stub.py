@@ -1,7 +1,13 @@
+import hashlib
+
 def recognize_plates_from_image(image_path: str):
     """Temporary stub that returns a fake plate list.
     Replace with actual detector + OCR integration.
+    The plate is derived from the file content, so distinct images give distinct plates.
     """
+    with open(image_path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest().upper()
+    plate = "STB" + str(int(digest[:8], 16) % 10000).zfill(4)
     return [
-        {"plate": "ABC1234", "confidence": 0.91, "bbox": [100, 120, 240, 60]}
+        {"plate": plate, "confidence": 0.91, "bbox": [100, 120, 240, 60]}
     ]
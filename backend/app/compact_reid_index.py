@@ -0,0 +1,50 @@
+"""
+Consolidate an existing re-id gallery: move owner/contact fields from every
+vector into one record per plate, drop near-duplicate vectors of the same
+plate and keep at most --max-per-plate diverse exemplars (farthest-point
+sampling), then rewrite vectors.f32 and rebuild the FAISS index.
+
+Uses the same REID_* settings as the API (app/reid_config.py). In shared mode
+the result is published as a new snapshot, so running workers pick it up
+without a restart; a local-mode index is refused while the API has it open.
+
+    cd backend
+    python -m app.compact_reid_index --dry-run
+    python -m app.compact_reid_index --max-per-plate 6
+"""
+import os
+import json
+import argparse
+
+from . import reid_config
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--index-dir", default=reid_config.INDEX_DIR)
+    ap.add_argument("--dim", type=int, default=None, help="embedding size (default: ask the configured embedder)")
+    ap.add_argument("--dedup", type=float, default=float(os.getenv("REID_DEDUP", "0.97")),
+                    help="cosine at or above which two vectors of a plate are duplicates (0 = off)")
+    ap.add_argument("--max-per-plate", type=int, default=int(os.getenv("REID_MAX_PER_PLATE", "8")))
+    ap.add_argument("--dry-run", action="store_true", help="report what would be dropped, change nothing")
+    args = ap.parse_args()
+
+    dim = args.dim or reid_config.embed_dim()
+    shared = os.path.exists(os.path.join(args.index_dir, "CURRENT"))
+    # a local dry run only reads, so it may run next to the API
+    local_kw = dict(read_only=True, exclusive=False) if args.dry_run and not shared else {}
+    try:
+        idx = reid_config.open_index(
+            dim, shared=shared, index_dir=args.index_dir,
+            dedup=args.dedup, max_per_plate=args.max_per_plate,
+            train_async=False,  # compact() retrains in the foreground when due
+            **local_kw,
+        )
+    except RuntimeError as e:
+        raise SystemExit(f"[compact] {e}: stop the API first (REID_INDEX_MODE=local)")
+    stats = idx.compact(dry_run=args.dry_run)
+    if shared and not args.dry_run:
+        stats["snapshot"] = idx.version
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    main()
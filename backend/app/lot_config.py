@@ -0,0 +1,145 @@
+"""
+Per-lot camera geometry for fixed cameras: region-of-interest polygons
+(where detection/OCR runs) and stall polygons (which stall a car is in).
+
+Config is a JSON file (LOT_CONFIG, default backend/config/lots.json):
+
+    {
+      "A": {
+        "image_size": [1920, 1080],          # resolution the polygons were drawn at
+        "roi":    [[[x, y], [x, y], ...], ...],
+        "stalls": {"A01": [[x, y], ...], "A02": [...]}
+      }
+    }
+
+Polygons are rescaled to the actual frame size. The file is read on first
+use and re-read when its mtime changes (checked at most every RELOAD_S), so
+geometry can be edited without restarting the API. Lots missing from the
+file (or no file at all) keep full-frame processing.
+"""
+import os
+import json
+import time
+import pathlib
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+LOT_CONFIG = os.getenv(
+    "LOT_CONFIG", str(pathlib.Path(__file__).resolve().parents[1] / "config" / "lots.json")
+)
+RELOAD_S = float(os.getenv("LOT_CONFIG_RELOAD_S", "2"))
+
+class LotGeometry:
+    def __init__(self, lot: str, cfg: Dict):
+        self.lot = lot
+        self.ref_size = tuple(cfg.get("image_size") or (0, 0))
+        self.roi = [np.asarray(p, dtype=np.float32) for p in cfg.get("roi", []) if len(p) >= 3]
+        self.stalls = {str(k): np.asarray(p, dtype=np.float32) for k, p in cfg.get("stalls", {}).items() if len(p) >= 3}
+        self._cache: Dict[Tuple[int, int], Dict] = {}  # (W, H) -> scaled polygons, rects, masks
+
+    def _scale(self, poly: np.ndarray, W: int, H: int) -> np.ndarray:
+        rw, rh = self.ref_size
+        sx = W / float(rw) if rw else 1.0
+        sy = H / float(rh) if rh else 1.0
+        return np.round(poly * np.array([sx, sy], dtype=np.float32)).astype(np.int32)
+
+    def _for_size(self, W: int, H: int) -> Dict:
+        key = (W, H)
+        if key not in self._cache:
+            regions = []
+            for poly in self.roi:
+                p = self._scale(poly, W, H)
+                x, y, w, h = cv2.boundingRect(p)
+                x, y = max(0, x), max(0, y)
+                w, h = min(W - x, w), min(H - y, h)
+                if w <= 0 or h <= 0:
+                    continue
+                mask = np.zeros((h, w), dtype=np.uint8)
+                cv2.fillPoly(mask, [p - np.array([x, y], dtype=np.int32)], 255)
+                regions.append((x, y, w, h, mask))
+            stalls = {k: self._scale(p, W, H) for k, p in self.stalls.items()}
+            self._cache[key] = {"regions": regions, "stalls": stalls}
+        return self._cache[key]
+
+    def crops(self, img: np.ndarray) -> List[Tuple[np.ndarray, int, int, np.ndarray]]:
+        """
+        One (crop, x0, y0, mask) per ROI polygon: the polygon's bounding rect,
+        unmasked, and the polygon's mask over it. Detectors search the whole
+        crop and drop boxes centred outside the mask; blacking the pixels out
+        instead would leave an edge along the polygon that swallows every
+        contour inside it. Empty list = no ROI configured.
+        """
+        H, W = img.shape[:2]
+        return [(img[y:y+h, x:x+w], x, y, mask) for (x, y, w, h, mask) in self._for_size(W, H)["regions"]]
+
+    def roi_pixels(self, W: int, H: int) -> Tuple[int, int]:
+        """(pixels in ROI bounding rects, pixels inside ROI polygons) at this frame size."""
+        regions = self._for_size(W, H)["regions"]
+        return sum(r[2] * r[3] for r in regions), sum(int(np.count_nonzero(r[4])) for r in regions)
+
+    def stall_for(self, bbox: Sequence[int], W: int, H: int, anchor: float = 0.9) -> Optional[str]:
+        """
+        Stall containing the box's ground point (horizontal centre, `anchor` of the
+        height down; use 0.5 for plate boxes), or None.
+        """
+        if not bbox:
+            return None
+        x, y, w, h = (float(v) for v in bbox[:4])
+        pt = (x + w / 2.0, y + h * anchor)
+        best, best_d = None, 0.0
+        for sid, poly in self._for_size(W, H)["stalls"].items():
+            d = cv2.pointPolygonTest(poly, pt, True)  # >0 inside, distance to edge
+            if d >= 0 and (best is None or d > best_d):
+                best, best_d = sid, d
+        return best
+
+_LOCK = threading.Lock()
+_LOTS: Dict[str, LotGeometry] = {}
+_MTIME: Optional[float] = None
+_CHECKED = 0.0
+
+def _reload_if_changed():
+    global _LOTS, _MTIME, _CHECKED
+    now = time.monotonic()
+    if now - _CHECKED < RELOAD_S and _CHECKED:
+        return
+    with _LOCK:
+        _CHECKED = now
+        try:
+            mtime = os.path.getmtime(LOT_CONFIG)
+        except OSError:
+            if _MTIME is not None:
+                print(f"[lots] {LOT_CONFIG} removed -> full-frame processing")
+            _LOTS, _MTIME = {}, None
+            return
+        if mtime == _MTIME:
+            return
+        try:
+            with open(LOT_CONFIG, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            lots = {str(k).upper(): LotGeometry(str(k).upper(), v) for k, v in raw.items()}
+        except Exception as e:
+            # keep serving the previous geometry rather than dropping ROIs on a bad edit
+            print(f"[lots] failed to load {LOT_CONFIG}: {type(e).__name__}: {e}")
+            _MTIME = mtime
+            return
+        _LOTS, _MTIME = lots, mtime
+        print(f"[lots] loaded geometry for lots {sorted(lots)} from {LOT_CONFIG}")
+
+def get_lot(lot: str) -> Optional[LotGeometry]:
+    _reload_if_changed()
+    geom = _LOTS.get(lot.upper())
+    return geom if geom is not None and geom.roi else None
+
+def stalls(lot: str) -> List[str]:
+    _reload_if_changed()
+    geom = _LOTS.get(lot.upper())
+    return sorted(geom.stalls) if geom is not None else []
+
+def stall_for(lot: str, bbox: Sequence[int], W: int, H: int, anchor: float = 0.9) -> Optional[str]:
+    _reload_if_changed()
+    geom = _LOTS.get(lot.upper())
+    return geom.stall_for(bbox, W, H, anchor) if geom is not None else None
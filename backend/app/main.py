@@ -3,6 +3,8 @@ from .routers import plates
 from .routers import upload
 from .routers import reid
 from .routers import history
+from .routers import media
+from .routers import lots
 
 
 app = FastAPI(title="ParkTrack API", version="0.2.0")
@@ -15,3 +17,5 @@ app.include_router(plates.router)
 app.include_router(upload.router)
 app.include_router(reid.router)
 app.include_router(history.router)
+app.include_router(media.router)
+app.include_router(lots.router)
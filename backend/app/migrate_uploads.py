@@ -0,0 +1,130 @@
+"""
+Move flat uploads (<uuid>.<ext> directly under STORAGE_DIR) into the
+content-addressed tree and point stored image_url values at /media/<sha><ext>.
+
+Per batch, originals are copied into the tree and DB rows are rewritten and
+committed (one UPDATE per table and batch, matching the batch's exact old
+file:// URLs). Re-id gallery metadata is then re-pointed through the index
+with the API's REID_* settings (published as a new snapshot in
+REID_INDEX_MODE=shared), and only after that are the flat files removed, so
+an interrupted run can simply be restarted. Identical files collapse into one
+stored copy. A local-mode gallery is refused while the API has it open: stop
+the API first, or it would overwrite the re-pointed metadata.
+
+    cd backend
+    python -m app.migrate_uploads --dry-run
+    python -m app.migrate_uploads --thumbs
+"""
+import os
+import argparse
+import pathlib
+from typing import Dict, List, Tuple
+
+from sqlalchemy import text
+
+from .db import SessionLocal
+from . import models, storage, reid_config
+
+def _flat_files(base: pathlib.Path) -> List[pathlib.Path]:
+    return sorted(p for p in base.iterdir() if p.is_file() and not p.name.startswith("."))
+
+def _old_urls(p: pathlib.Path) -> List[str]:
+    # flat uploads were stored as file://<absolute path>; accept the bare path too
+    return [f"file://{p}", str(p)]
+
+def _rewrite_db(db, renames: List[Tuple[pathlib.Path, str]]) -> int:
+    # one UPDATE per table, joined on the exact old URLs of this batch
+    if not renames:
+        return 0
+    pairs = [(old, new_url) for p, new_url in renames for old in _old_urls(p)]
+    values = ", ".join(f"(:o{i}, :n{i})" for i in range(len(pairs)))
+    params = {}
+    for i, (old_url, new_url) in enumerate(pairs):
+        params[f"o{i}"], params[f"n{i}"] = old_url, new_url
+    n = 0
+    for model in (models.ParkingHistory, models.ParkingSession, models.IngestLog):
+        table = model.__tablename__
+        n += db.execute(text(
+            f"UPDATE {table} AS t SET image_url = v.new_url "
+            f"FROM (VALUES {values}) AS v(old_url, new_url) "
+            f"WHERE t.image_url = v.old_url"
+        ), params).rowcount
+    return n
+
+def _open_index(dim: int):
+    """The re-id gallery as the API opens it, or None if there is none yet."""
+    index_dir = reid_config.INDEX_DIR
+    if not any(os.path.exists(os.path.join(index_dir, f)) for f in ("CURRENT", "meta.json")):
+        return None
+    try:
+        return reid_config.open_index(dim or reid_config.embed_dim(), index_dir=index_dir, train_async=False)
+    except RuntimeError as e:
+        raise SystemExit(f"[migrate] {e}: stop the API first (REID_INDEX_MODE=local)")
+
+def _rewrite_index_meta(idx, renames: Dict[str, str]) -> int:
+    if idx is None:
+        return 0
+
+    def repoint(item) -> bool:
+        new_url = renames.get(item.get("image_url") or "")
+        if new_url is None:
+            return False
+        item["image_url"] = new_url
+        return True
+    return idx.update_items(repoint)
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dry-run", action="store_true", help="report what would move, change nothing")
+    ap.add_argument("--batch", type=int, default=500)
+    ap.add_argument("--thumbs", action="store_true", help="also build thumbnails now instead of on first request")
+    ap.add_argument("--dim", type=int, default=None, help="re-id embedding size (default: ask the configured embedder)")
+    args = ap.parse_args()
+
+    base = storage.base_dir()
+    files = _flat_files(base)
+    print(f"[migrate] {len(files)} flat files under {base}")
+
+    # before anything moves: refuse early if a local-mode API holds the gallery
+    idx = None if args.dry_run else _open_index(args.dim)
+
+    moved = dup = rows = 0
+    all_renames: Dict[str, str] = {}
+    db = SessionLocal()
+    try:
+        for i in range(0, len(files), args.batch):
+            batch = files[i:i + args.batch]
+            renames: List[Tuple[pathlib.Path, str]] = []
+            for p in batch:
+                content = p.read_bytes()
+                if args.dry_run:
+                    renames.append((p, storage.url_for(storage.content_key(content))))
+                    continue
+                stored = storage.store_bytes(content)
+                moved += 1
+                dup += int(not stored.created)
+                renames.append((p, stored.url))
+                if args.thumbs:
+                    storage.build_derivative(storage.thumb_name(stored.key))
+            all_renames.update((old, new_url) for p, new_url in renames for old in _old_urls(p))
+
+            if args.dry_run:
+                continue
+            rows += _rewrite_db(db, renames)
+            db.commit()
+            print(f"[migrate] {min(i + args.batch, len(files))}/{len(files)} files, {rows} rows updated")
+    finally:
+        db.close()
+
+    if args.dry_run:
+        print(f"[migrate] dry run: {len(files)} files -> {len(set(all_renames.values()))} unique stored images")
+        return
+    meta_n = _rewrite_index_meta(idx, all_renames)
+    # flat files go only once nothing points at them any more
+    for p in files:
+        p.unlink()
+    print(f"[migrate] done: {moved} files moved ({dup} duplicates collapsed), "
+          f"{rows} DB rows and {meta_n} re-id entries re-pointed")
+
+if __name__ == "__main__":
+    main()
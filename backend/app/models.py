@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, TIMESTAMP, BigInteger, Float, CHAR, ForeignKey
+from sqlalchemy import Column, String, Text, TIMESTAMP, BigInteger, Integer, Float, CHAR, ForeignKey
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import JSONB
 from .db import Base
@@ -23,6 +23,22 @@ class ParkingHistory(Base):
     bbox = Column(JSONB)
     confidence = Column(Float)
 
+class ParkingSession(Base):
+    """One visit: consecutive sightings of a plate in a lot, no gap longer than SESSION_GAP_S."""
+    __tablename__ = "parking_session"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    plate = Column(String(16), ForeignKey("car.plate", ondelete="CASCADE"))
+    lot = Column(CHAR(1))
+    stall = Column(String(16))  # from lot geometry (lot_config), latest sighting wins
+    entry_time = Column(TIMESTAMP)
+    last_seen = Column(TIMESTAMP)
+    exit_time = Column(TIMESTAMP)  # NULL while the visit is open
+    sightings = Column(Integer, default=1)
+    best_confidence = Column(Float)
+    image_url = Column(Text)  # image of the best-confidence sighting
+    bbox = Column(JSONB)
+    last_sampled_at = Column(TIMESTAMP)  # last raw parking_history row written
+
 class IngestLog(Base):
     __tablename__ = "ingest_log"
     id = Column(BigInteger, primary_key=True, autoincrement=True)
@@ -0,0 +1,58 @@
+"""
+Re-id gallery settings (REID_* environment), shared by the API and the
+maintenance scripts so every process opens the index the same way.
+"""
+import os
+import sys
+import pathlib
+from typing import Any, Dict, Optional
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from carid import indexer  # noqa: E402
+
+# where FAISS + meta live
+INDEX_DIR = str(pathlib.Path(__file__).resolve().parents[1] / "data" / "reid_index")
+
+# local  : one private CarIndex per process (single worker only)
+# shared : versioned snapshots, one writer at a time, mmap'd readers that
+#          hot-swap on new versions -> use with `uvicorn --workers N`
+INDEX_MODE = os.getenv("REID_INDEX_MODE", "local").lower()
+
+def index_kwargs(**overrides) -> Dict[str, Any]:
+    # vector storage: flat | sq16 | sq8 | pq | opq (see carid/indexer.py)
+    kwargs: Dict[str, Any] = dict(
+        storage=os.getenv("REID_INDEX_STORAGE", "flat"),
+        pq_m=int(os.getenv("REID_PQ_M", "64")),
+        rerank=int(os.getenv("REID_RERANK", "4")),  # 1 = no exact re-scoring
+        # per-plate gallery: skip near-duplicates, keep a bounded diverse set of exemplars
+        dedup=float(os.getenv("REID_DEDUP", "0.97")),  # 0 = store every enrollment
+        max_per_plate=int(os.getenv("REID_MAX_PER_PLATE", "8")),  # 0 = unbounded
+        centroid_probe=int(os.getenv("REID_CENTROID_PROBE", "0")),  # >0 = per-plate centroid first stage
+    )
+    kwargs.update(overrides)
+    return kwargs
+
+def embed_dim() -> int:
+    """Embedding size of the configured embedder (loads the model, like the API does)."""
+    if os.getenv("PARKTRACK_STUB_MODELS", "0") == "1":
+        from carid import stub as embedder  # type: ignore
+    else:
+        from carid import embedder  # type: ignore
+    return embedder.dim()
+
+def open_index(dim: int, shared: Optional[bool] = None, index_dir: str = INDEX_DIR, **overrides):
+    """
+    The gallery at `index_dir` with the REID_* settings (plus `overrides`).
+    shared=None follows the directory layout (snapshots -> SharedCarIndex).
+    A local CarIndex is opened exclusively unless overridden: a second process
+    opening it that way gets a RuntimeError instead of silently overwriting it.
+    """
+    if shared is None:
+        shared = os.path.exists(os.path.join(index_dir, "CURRENT"))
+    poll_s = overrides.pop("poll_s", float(os.getenv("REID_INDEX_POLL_S", "1.0")))
+    if shared:
+        return indexer.SharedCarIndex(root_dir=index_dir, dim=dim, poll_s=poll_s, **index_kwargs(**overrides))
+    return indexer.CarIndex(root_dir=index_dir, dim=dim, **index_kwargs(**{"exclusive": True, **overrides}))
@@ -6,13 +6,69 @@ from sqlalchemy.orm import Session
 from sqlalchemy import desc
 
 from ..db import get_db
-from .. import models
+from .. import models, sessions
 
 router = APIRouter(prefix="/api/v1/history", tags=["history"])
 
 def _utcnow():
     return dt.datetime.utcnow()
 
+@router.get("/{plate}/sessions")
+def get_sessions_for_plate(
+    plate: str,
+    days: int = Query(30, ge=1, le=365),
+    lot: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Returns parking visits (one row per visit, newest first) that started in the
+    last `days`, with dwell time, plus total dwell per lot.
+    """
+    plate = plate.upper().strip()
+    if not db.get(models.Car, plate):
+        raise HTTPException(status_code=404, detail=f"Plate '{plate}' not found")
+
+    now = _utcnow()
+    cutoff = now - dt.timedelta(days=days)
+    q = (
+        db.query(models.ParkingSession)
+        .filter(models.ParkingSession.plate == plate)
+        .filter(models.ParkingSession.entry_time >= cutoff)
+    )
+    if lot:
+        q = q.filter(models.ParkingSession.lot == lot.upper())
+    rows: List[models.ParkingSession] = q.order_by(desc(models.ParkingSession.entry_time)).all()
+
+    visits: List[Dict[str, Any]] = []
+    dwell_per_lot: Dict[str, int] = {}
+    for s in rows:
+        exit_time = sessions.exit_time(s, now)
+        dwell_s = int(((exit_time or s.last_seen) - s.entry_time).total_seconds())
+        dwell_per_lot[s.lot] = dwell_per_lot.get(s.lot, 0) + dwell_s
+        visits.append({
+            "id": s.id,
+            "lot": s.lot,
+            "stall": s.stall,
+            "entry_time": s.entry_time.isoformat(),
+            "last_seen": s.last_seen.isoformat(),
+            "exit_time": exit_time.isoformat() if exit_time else None,
+            "open": exit_time is None,
+            "dwell_seconds": dwell_s,
+            "sightings": s.sightings,
+            "best_confidence": s.best_confidence,
+            "image_url": s.image_url,
+            "bbox": s.bbox,
+        })
+
+    return {
+        "plate": plate,
+        "range_days": days,
+        "session_gap_seconds": sessions.SESSION_GAP_S,
+        "sessions_count": len(visits),
+        "sessions": visits,
+        "dwell_seconds_per_lot": dwell_per_lot,
+    }
+
 @router.get("/{plate}")
 def get_history_for_plate(
     plate: str,
@@ -0,0 +1,65 @@
+from typing import List, Dict, Any
+import datetime as dt
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy import desc
+
+from ..db import get_db
+from .. import models, sessions, lot_config
+
+router = APIRouter(prefix="/api/v1/lots", tags=["lots"])
+
+@router.get("/{lot}/occupancy")
+def get_lot_occupancy(lot: str, db: Session = Depends(get_db)):
+    """
+    Current stall occupancy for a lot, from open parking sessions. Open visits
+    that were not placed in a configured stall are listed under `unassigned`.
+    """
+    lot = lot.upper().strip()
+    if lot not in ("A", "B", "C"):
+        raise HTTPException(status_code=400, detail="lot must be one of A, B, C")
+    now = dt.datetime.utcnow()
+    cutoff = now - dt.timedelta(seconds=sessions.SESSION_GAP_S)
+    rows: List[models.ParkingSession] = (
+        db.query(models.ParkingSession)
+        .filter(models.ParkingSession.lot == lot)
+        .filter(models.ParkingSession.exit_time.is_(None))
+        .filter(models.ParkingSession.last_seen >= cutoff)
+        .order_by(desc(models.ParkingSession.last_seen))
+        .all()
+    )
+
+    stall_ids = lot_config.stalls(lot)
+    by_stall: Dict[str, models.ParkingSession] = {}
+    unassigned: List[Dict[str, Any]] = []
+    for s in rows:
+        if s.stall in stall_ids and s.stall not in by_stall:
+            by_stall[s.stall] = s  # newest sighting wins if two visits claim a stall
+            continue
+        unassigned.append({
+            "plate": s.plate,
+            "stall": s.stall,
+            "since": s.entry_time.isoformat(),
+            "last_seen": s.last_seen.isoformat(),
+        })
+
+    stalls = []
+    for sid in stall_ids:
+        s = by_stall.get(sid)
+        stalls.append({
+            "stall": sid,
+            "occupied": s is not None,
+            "plate": s.plate if s else None,
+            "since": s.entry_time.isoformat() if s else None,
+            "last_seen": s.last_seen.isoformat() if s else None,
+        })
+
+    return {
+        "lot": lot,
+        "stalls_total": len(stall_ids),
+        "stalls_occupied": len(by_stall),
+        "open_sessions": len(rows),
+        "stalls": stalls,
+        "unassigned": unassigned,
+    }
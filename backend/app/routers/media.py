@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+
+from .. import storage
+
+router = APIRouter(prefix=storage.MEDIA_PREFIX, tags=["media"])
+
+# names are content hashes, so a URL's bytes never change
+_CACHE_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
+
+@router.get("/{name}")
+async def get_media(name: str):
+    """
+    Serves an original upload, thumbnail or crop by its content-addressed name.
+    Derivatives the background worker has not produced yet are built on demand,
+    but only the thumbnail and crops that an upload actually enqueued.
+    """
+    m = storage.NAME_RE.match(name)
+    if not m:
+        raise HTTPException(status_code=404, detail="not found")
+    path = storage.path_for(name)
+    if not path.exists():
+        if not await run_in_threadpool(storage.is_registered, name):
+            raise HTTPException(status_code=404, detail="not found")
+        path = await run_in_threadpool(storage.build_derivative, name)
+        if path is None:
+            raise HTTPException(status_code=404, detail="not found")
+    return FileResponse(path, headers=_CACHE_HEADERS)
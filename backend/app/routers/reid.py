@@ -1,14 +1,14 @@
 import os
-import uuid
 import pathlib
 import datetime as dt
 from typing import List, Dict, Any, Optional
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from ..db import get_db
-from .. import models
+from .. import models, sessions, storage, lot_config, reid_config
 
 # allow importing carid/* (repo root)
 import sys
@@ -17,38 +17,21 @@ REPO_ROOT = HERE.parents[3]  # C:\parktrack
 if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
-from carid import detector, embedder, indexer  # type: ignore
+if os.getenv("PARKTRACK_STUB_MODELS", "0") == "1":
+    # model-free detector/embedder (load tests of the API/DB path)
+    from carid import stub as detector, stub as embedder  # type: ignore
+else:
+    from carid import detector, embedder  # type: ignore
 
 router = APIRouter(prefix="/api/v1/reid", tags=["reid"])
 
-# ---------- paths / storage ----------
-STORAGE_DIR = os.getenv("STORAGE_DIR", "uploads")  # under backend/
-def _backend_root() -> pathlib.Path:
-    return pathlib.Path(__file__).resolve().parents[2]  # .../backend
-
-def _ensure_storage_dir() -> pathlib.Path:
-    base = _backend_root() / STORAGE_DIR
-    base.mkdir(parents=True, exist_ok=True)
-    return base
-
-# where FAISS + meta live
-INDEX_DIR = str(_backend_root() / "data" / "reid_index")
-pathlib.Path(INDEX_DIR).mkdir(parents=True, exist_ok=True)
-
 # ---------- global index ----------
+# where FAISS + meta live, storage and gallery settings: see app/reid_config.py
+pathlib.Path(reid_config.INDEX_DIR).mkdir(parents=True, exist_ok=True)
 _DIM = embedder.dim()  # 512 for ViT-B/32
-_INDEX = indexer.CarIndex(root_dir=INDEX_DIR, dim=_DIM)
+_INDEX = reid_config.open_index(_DIM, shared=reid_config.INDEX_MODE == "shared")
 
 # ---------- helpers ----------
-def _save_upload(file: UploadFile) -> pathlib.Path:
-    base = _ensure_storage_dir()
-    ext = pathlib.Path(file.filename or "").suffix.lower() or ".jpg"
-    uid = uuid.uuid4().hex
-    p = base / f"{uid}{ext}"
-    content = file.file.read()
-    with open(p, "wb") as f:
-        f.write(content)
-    return p
 
 def _upsert_car(db: Session, plate: str, owner_name: Optional[str], owner_contact: Optional[str], car_model: Optional[str], notes: Optional[str]):
     plate = plate.upper().strip()
@@ -88,15 +71,16 @@ async def enroll_car(
     - Adds vector to FAISS with meta (plate, model, etc.)
     - Upserts Car row in DB
     """
-    # save upload
-    path = _save_upload(file)
-    image_url = f"file://{path}"
+    # save upload (content-addressed, off the event loop)
+    stored = await storage.save_upload(file)
+    path = stored.path
+    image_url = stored.url
 
     # detect vehicles (largest first)
     img = cv2.imread(str(path))
     if img is None:
         raise HTTPException(status_code=400, detail="bad image")
-    boxes = detector.detect_vehicles(img)
+    boxes = await run_in_threadpool(detector.detect_vehicles, img)
     x, y, w, h, score, label = boxes[0]  # take largest candidate
     crop = img[y:y+h, x:x+w]
 
@@ -111,22 +95,29 @@ async def enroll_car(
         "image_url": image_url,
         "bbox": [x, y, w, h],
     }]
-    ids = _INDEX.add(vec, metas)
+    # shared mode waits on the cross-process writer lock and copies the snapshot:
+    # keep that off the event loop
+    ids, stored_vec = await run_in_threadpool(_INDEX.add, vec, metas, True)
 
     # upsert car in DB
     _upsert_car(db, plate, owner_name, owner_contact, car_model, notes)
     db.commit()
 
+    media = storage.enqueue_derivatives(stored.key, {"vehicle": [[x, y, w, h]]})
+
     return {
         "enrolled_id": ids[0],
+        # False: the crop was a near-duplicate of (or less diverse than) this plate's
+        # stored exemplars; enrolled_id is then the closest stored exemplar
+        "stored": stored_vec[0],
         "plate": plate.upper(),
         "detector_box": [x, y, w, h],
         "image_url": image_url,
+        "thumb_url": media["thumb_url"],
         "meta": metas[0],
     }
 
 import cv2
-import numpy as np
 
 @router.post("/identify-cars")
 async def identify_cars(
@@ -147,35 +138,36 @@ async def identify_cars(
     if lot not in ("A", "B", "C"):
         raise HTTPException(status_code=400, detail="lot must be one of A, B, C")
 
-    path = _save_upload(file)
-    image_url = f"file://{path}"
+    stored = await storage.save_upload(file)
+    path = stored.path
+    image_url = stored.url
 
     img = cv2.imread(str(path))
     if img is None:
         raise HTTPException(status_code=400, detail="bad image")
 
-    boxes = detector.detect_vehicles(img)  # up to 20
+    # only the lot's ROI (fixed cameras), off the event loop so concurrent
+    # requests can share batched YOLO calls
+    geom = lot_config.get_lot(lot)
+    regions = geom.crops(img) if geom is not None else None
+    boxes = await run_in_threadpool(detector.detect_vehicles, img, regions)  # up to 20
+    H, W = img.shape[:2]
     detections: List[Dict[str, Any]] = []
 
-    # embed all crops
-    vecs = []
-    crops = []
-    for (x, y, w, h, score, label) in boxes:
-        crop = img[y:y+h, x:x+w]
-        crops.append((x, y, w, h))
-        v = embedder.embed_bgr_image(crop)
-        vecs.append(v)
-    if not vecs:
+    # embed all crops (one batched forward pass)
+    crops = [(x, y, w, h) for (x, y, w, h, score, label) in boxes]
+    if not crops:
         return {"lot": lot, "count": 0, "detections": []}
 
-    Q = np.vstack(vecs).astype("float32")  # (N,512)
-    results = _INDEX.search(Q, k=int(topk))
+    Q = embedder.embed_bgr_images([img[y:y+h, x:x+w] for (x, y, w, h) in crops])  # (N,512)
+    results = await run_in_threadpool(_INDEX.search, Q, int(topk))
 
     now = dt.datetime.utcnow()
     written = 0
     out = []
     for i, matches in enumerate(results):
         x, y, w, h = crops[i]
+        stall = lot_config.stall_for(lot, [x, y, w, h], W, H)
         top = matches[0] if matches else None
         match_plate = None
         match_score = None
@@ -192,19 +184,17 @@ async def identify_cars(
                     car = models.Car(plate=match_plate)
                     db.add(car)
                 car.last_seen = now
+                db.flush()  # car row must exist before the session/history FKs
 
-                ph = models.ParkingHistory(
-                    plate=match_plate,
-                    lot=lot,
-                    image_url=image_url,
-                    confidence=float(match_score),
-                    bbox=[x, y, w, h],
+                _, wrote = sessions.record_sighting(
+                    db, match_plate, lot, now, float(match_score), image_url, [x, y, w, h], stall=stall
                 )
-                db.add(ph)
-                written += 1
+                db.flush()
+                written += int(wrote)
 
         out.append({
             "bbox": [x, y, w, h],
+            "stall": stall,
             "top_matches": matches,  # includes id, score, meta
             "matched_plate": match_plate,
             "matched_score": match_score,
@@ -212,9 +202,12 @@ async def identify_cars(
 
     db.commit()
 
+    media = storage.enqueue_derivatives(stored.key, {"vehicle": [list(c) for c in crops]})
+
     return {
         "lot": lot,
         "image_url": image_url,
+        "thumb_url": media["thumb_url"],
         "count": len(boxes),
         "detections": out,
         "written_history": written,
@@ -3,14 +3,16 @@ import uuid
 import json
 import pathlib
 import datetime as dt
+import functools
 import traceback
 from typing import Optional, Any, Dict
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from ..db import get_db
-from .. import models
+from .. import models, sessions, storage, lot_config
 
 # ------------ Add repo root to sys.path (so "alpr" imports work) ------------
 # .../backend/app/routers/upload.py  -> parents[3] == repo root (C:\parktrack)
@@ -24,27 +26,25 @@ print(f"[upload] REPO_ROOT added to sys.path: {REPO_ROOT}")
 USING_STUB = True
 IMPORT_ERROR: Optional[str] = None
 
-try:
-    from alpr.pipeline import recognize_plates_from_image
-    USING_STUB = False
-    print("[upload] ALPR pipeline import: OK (tesseract_pipeline)")
-except Exception as e:
-    IMPORT_ERROR = f"{type(e).__name__}: {e}"
-    print(f"[upload] ALPR pipeline import FAILED -> using stub. Reason: {IMPORT_ERROR}")
-    traceback.print_exc()
+# PARKTRACK_STUB_MODELS=1 skips detector/OCR entirely (load tests of the API/DB path)
+STUB_MODELS = os.getenv("PARKTRACK_STUB_MODELS", "0") == "1"
 
-    def recognize_plates_from_image(image_path: str):
-        return [{"plate": "ABC1234", "confidence": 0.91, "bbox": [100, 120, 240, 60]}]
-
-router = APIRouter(prefix="/api/v1", tags=["upload"])
+if STUB_MODELS:
+    from alpr.stub import recognize_plates_from_image
+    print("[upload] PARKTRACK_STUB_MODELS=1 -> using stub")
+else:
+    try:
+        from alpr.pipeline import recognize_plates_from_image
+        USING_STUB = False
+        print("[upload] ALPR pipeline import: OK (tesseract_pipeline)")
+    except Exception as e:
+        IMPORT_ERROR = f"{type(e).__name__}: {e}"
+        print(f"[upload] ALPR pipeline import FAILED -> using stub. Reason: {IMPORT_ERROR}")
+        traceback.print_exc()
 
-STORAGE_DIR = os.getenv("STORAGE_DIR", "uploads")
+        from alpr.stub import recognize_plates_from_image
 
-def _ensure_storage_dir() -> pathlib.Path:
-    backend_root = pathlib.Path(__file__).resolve().parents[2]  # .../backend
-    base = backend_root / STORAGE_DIR
-    base.mkdir(parents=True, exist_ok=True)
-    return base
+router = APIRouter(prefix="/api/v1", tags=["upload"])
 
 def _norm_bbox(b: Any) -> Optional[Any]:
     if b is None:
@@ -66,21 +66,14 @@ async def upload_image(
     if lot not in ("A", "B", "C"):
         raise HTTPException(status_code=400, detail="lot must be one of A, B, C")
 
-    # --- save file to disk ---
-    storage_base = _ensure_storage_dir()
-    ext = pathlib.Path(file.filename or "").suffix.lower() or ".jpg"
+    # --- save file to content-addressed storage (off the event loop) ---
     uid = uuid.uuid4().hex
-    saved_name = f"{uid}{ext}"
-    saved_path = storage_base / saved_name
-
-    content = await file.read()
     try:
-        with open(saved_path, "wb") as f:
-            f.write(content)
+        stored = await storage.save_upload(file)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"failed to save file: {e}")
-
-    image_url = f"file://{saved_path}"
+    saved_path = stored.path
+    image_url = stored.url
 
     # --- ingest log: pending ---
     request_id = uid
@@ -94,9 +87,23 @@ async def upload_image(
     db.commit()
     db.refresh(ingest)
 
-    # --- run ALPR (pipeline or stub) ---
+    # --- run ALPR (pipeline or stub), only inside the lot's ROI if one is configured ---
+    # the pipeline hands back the frame size it decoded, needed for stall mapping
+    geom = lot_config.get_lot(lot)
+    recognize = recognize_plates_from_image
+    if not USING_STUB:
+        recognize = functools.partial(
+            recognize_plates_from_image,
+            roi=geom.crops if geom is not None else None,
+            with_size=True,
+        )
+    frame_hw = None
     try:
-        detections = recognize_plates_from_image(str(saved_path)) or []
+        # off the event loop, so concurrent requests can share batched YOLO calls
+        result = await run_in_threadpool(recognize, str(saved_path))
+        if not USING_STUB:
+            result, frame_hw = result
+        detections = result or []
     except Exception as e:
         ingest.status = "failed"
         ingest.raw_response = {"error": f"alpr_exception: {type(e).__name__}: {e}"}
@@ -116,8 +123,15 @@ async def upload_image(
                 "plate": plate,
                 "confidence": conf,
                 "bbox": _norm_bbox(det.get("bbox")),
+                "vehicle_bbox": det.get("vehicle_bbox"),  # set in ALPR_CASCADE mode
             }
 
+    # --- the stub never decodes the image; read the frame size only if a stall lookup needs it ---
+    if frame_hw is None and best_per_plate and lot_config.stalls(lot):
+        import cv2
+        img = await run_in_threadpool(cv2.imread, str(saved_path))
+        frame_hw = img.shape[:2] if img is not None else None
+
     # --- write unique plates to DB ---
     written = []
     now = dt.datetime.utcnow()
@@ -128,20 +142,32 @@ async def upload_image(
             car = models.Car(plate=plate)
             db.add(car)
         car.last_seen = now
-
-        ph = models.ParkingHistory(
-            plate=plate,
-            lot=lot,
-            image_url=str(image_url),
-            confidence=float(det["confidence"]),
-            bbox=det["bbox"],
+        db.flush()  # car row must exist before the session/history FKs
+
+        stall = None
+        if frame_hw is not None:
+            H, W = frame_hw
+            if det["vehicle_bbox"]:
+                stall = lot_config.stall_for(lot, det["vehicle_bbox"], W, H)
+            elif isinstance(det["bbox"], (list, tuple)):
+                stall = lot_config.stall_for(lot, det["bbox"], W, H, anchor=0.5)
+
+        session, _ = sessions.record_sighting(
+            db, plate, lot, now, float(det["confidence"]), str(image_url), det["bbox"], stall=stall
         )
-        db.add(ph)
+        db.flush()
 
         written.append(
-            {"plate": plate, "lot": lot, "confidence": float(det["confidence"]), "bbox": det["bbox"]}
+            {"plate": plate, "lot": lot, "confidence": float(det["confidence"]), "bbox": det["bbox"],
+             "vehicle_bbox": det["vehicle_bbox"], "stall": stall, "session_id": session.id}
         )
 
+    # --- thumbnail + plate/vehicle crops in the background ---
+    media = storage.enqueue_derivatives(stored.key, {
+        "plate": [w["bbox"] for w in written if w["bbox"]],
+        "vehicle": [w["vehicle_bbox"] for w in written if w["vehicle_bbox"]],
+    })
+
     # --- finalize ingest log ---
     ingest.status = "success"
     ingest.raw_response = {
@@ -155,6 +181,9 @@ async def upload_image(
     return {
         "request_id": request_id,
         "saved": str(saved_path),
+        "image_url": image_url,
+        "thumb_url": media["thumb_url"],
+        "crop_urls": media["crop_urls"],
         "lot": lot,
         "engine": engine_used,
         "detections": written,  # only the DB-written, deduped plates
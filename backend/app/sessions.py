@@ -0,0 +1,85 @@
+import os
+import datetime as dt
+from typing import Any, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+# a plate re-seen in the same lot within this gap continues the same visit
+SESSION_GAP_S = int(os.getenv("SESSION_GAP_S", "900"))
+# write at most one raw parking_history row per visit every N seconds (0 = every sighting)
+HISTORY_SAMPLE_S = int(os.getenv("HISTORY_SAMPLE_S", "0"))
+
+def is_open(s: models.ParkingSession, now: dt.datetime) -> bool:
+    return s.exit_time is None and (now - s.last_seen).total_seconds() <= SESSION_GAP_S
+
+def exit_time(s: models.ParkingSession, now: dt.datetime) -> Optional[dt.datetime]:
+    """Stored exit time, or last_seen once the gap has expired without a new sighting."""
+    if s.exit_time is not None:
+        return s.exit_time
+    return None if is_open(s, now) else s.last_seen
+
+def record_sighting(
+    db: Session,
+    plate: str,
+    lot: str,
+    now: dt.datetime,
+    confidence: float,
+    image_url: Optional[str],
+    bbox: Any,
+    stall: Optional[str] = None,
+) -> Tuple[models.ParkingSession, bool]:
+    """
+    Fold one sighting into the plate's current visit (or start a new one) and
+    write the raw parking_history row unless HISTORY_SAMPLE_S downsamples it.
+    The car row must exist (caller flushes it); it is locked for the rest of
+    the transaction so concurrent first sightings of a plate cannot each
+    open a visit (backed by the unique open-visit index in db/schema.sql).
+    Caller commits. Returns (session, wrote_history_row).
+    """
+    db.get(models.Car, plate, with_for_update=True)
+    session = None
+    open_rows = (
+        db.query(models.ParkingSession)
+        .filter(models.ParkingSession.plate == plate)
+        .filter(models.ParkingSession.exit_time.is_(None))
+        .with_for_update()
+        .all()
+    )
+    for s in open_rows:
+        if s.lot == lot and is_open(s, now):
+            session = s
+        else:
+            s.exit_time = s.last_seen  # gap expired or the car moved to another lot
+
+    if session is None:
+        db.flush()  # close the previous visit before the new one is inserted
+        session = models.ParkingSession(
+            plate=plate, lot=lot, stall=stall, entry_time=now, last_seen=now, sightings=1,
+            best_confidence=confidence, image_url=image_url, bbox=bbox,
+        )
+        db.add(session)
+    else:
+        session.last_seen = now
+        session.sightings = (session.sightings or 0) + 1
+        if stall:
+            session.stall = stall
+        if confidence > (session.best_confidence or 0.0):
+            session.best_confidence = confidence
+            session.image_url = image_url
+            session.bbox = bbox
+
+    wrote = False
+    last = session.last_sampled_at
+    if HISTORY_SAMPLE_S <= 0 or last is None or (now - last).total_seconds() >= HISTORY_SAMPLE_S:
+        db.add(models.ParkingHistory(
+            plate=plate,
+            lot=lot,
+            image_url=image_url,
+            confidence=confidence,
+            bbox=bbox,
+        ))
+        session.last_sampled_at = now
+        wrote = True
+    return session, wrote
@@ -0,0 +1,220 @@
+"""
+Content-addressed image storage.
+
+Uploads are stored once per content hash in a sharded tree
+
+    <backend>/<STORAGE_DIR>/ab/cd/abcd...64hex.jpg
+
+and addressed by a stable URL that does not depend on the disk layout:
+`/media/<sha256><ext>`. Derivatives live next to the original and are named
+after it, so they can be (re)built from the name alone:
+
+    <sha>.thumb.webp                 downscaled thumbnail
+    <sha>.<kind>-x-y-w-h.jpg         plate / vehicle crop (full-frame bbox)
+    <sha>.manifest                   crop names enqueued for this original
+
+The extension comes from the decoded image type (magic bytes), never from the
+client's filename, so identical bytes always map to one key.
+A background thread builds derivatives after each upload; the media route
+builds missing ones on first request, but only the thumbnail and crops listed
+in the manifest, so made-up crop names cannot create files.
+"""
+import os
+import re
+import queue
+import hashlib
+import pathlib
+import threading
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from fastapi.concurrency import run_in_threadpool
+
+STORAGE_DIR = os.getenv("STORAGE_DIR", "uploads")  # under backend/
+MEDIA_PREFIX = "/media"
+THUMB_MAX = int(os.getenv("THUMB_MAX", "320"))          # longest side, px
+THUMB_FORMAT = os.getenv("THUMB_FORMAT", "webp").lower()  # webp | jpg
+CROP_KINDS = ("plate", "vehicle")
+
+# magic bytes -> stored extension; anything else is stored as .jpg
+_MAGIC = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF8", ".gif"),
+    (b"BM", ".bmp"),
+    (b"II*\x00", ".tif"),
+    (b"MM\x00*", ".tif"),
+)
+EXTENSIONS = (".jpg", ".png", ".webp", ".gif", ".bmp", ".tif")
+
+# <sha256><ext> or <sha256>.<derivative>.<ext>
+NAME_RE = re.compile(r"^([0-9a-f]{64})(\.(?:jpg|png|webp|gif|bmp|tif)|\.thumb\.(?:webp|jpg)|\.(plate|vehicle)-(\d+)-(\d+)-(\d+)-(\d+)\.jpg)$")
+
+class Stored(NamedTuple):
+    key: str            # "<sha256><ext>"
+    path: pathlib.Path  # absolute path of the original
+    url: str            # stable public URL
+    created: bool       # False if identical content was already stored
+
+def base_dir() -> pathlib.Path:
+    base = pathlib.Path(__file__).resolve().parents[1] / STORAGE_DIR  # .../backend/uploads
+    base.mkdir(parents=True, exist_ok=True)
+    return base
+
+def path_for(name: str) -> pathlib.Path:
+    """Disk path for an original or derivative file name (sharded by hash prefix)."""
+    return base_dir() / name[:2] / name[2:4] / name
+
+def url_for(name: str) -> str:
+    return f"{MEDIA_PREFIX}/{name}"
+
+def _ext(content: bytes) -> str:
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return ".webp"
+    for magic, ext in _MAGIC:
+        if content.startswith(magic):
+            return ext
+    return ".jpg"
+
+def _write_atomic(path: pathlib.Path, content: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+def content_key(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest() + _ext(content)
+
+def store_bytes(content: bytes) -> Stored:
+    """Blocking store; duplicates of already-stored content are not written again."""
+    key = content_key(content)
+    path = path_for(key)
+    created = not path.exists()
+    if created:
+        _write_atomic(path, content)
+    return Stored(key, path, url_for(key), created)
+
+async def save_upload(file) -> Stored:
+    """Read an UploadFile and store it without blocking the event loop."""
+    content = await file.read()
+    return await run_in_threadpool(store_bytes, content)
+
+# ---------- derivatives ----------
+def thumb_name(key: str) -> str:
+    return f"{key[:64]}.thumb.{THUMB_FORMAT}"
+
+def crop_name(key: str, kind: str, bbox: Sequence[int]) -> str:
+    x, y, w, h = (max(0, int(v)) for v in bbox[:4])
+    return f"{key[:64]}.{kind}-{x}-{y}-{w}-{h}.jpg"
+
+def _manifest_path(key: str) -> pathlib.Path:
+    return path_for(f"{key[:64]}.manifest")
+
+_MANIFEST_LOCK = threading.Lock()
+
+def _register(key: str, names: List[str]) -> None:
+    """Record crop names as legitimate derivatives of `key` (one per line, append-only)."""
+    if not names:
+        return
+    path = _manifest_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _MANIFEST_LOCK, open(path, "a", encoding="utf-8") as f:
+        f.write("".join(n + "\n" for n in names))
+
+def is_registered(name: str) -> bool:
+    """True if `name` may be built on demand: the thumbnail, or a crop that was enqueued."""
+    m = NAME_RE.match(name)
+    if not m:
+        return False
+    if ".thumb." in name:
+        return name == thumb_name(name)
+    if m.group(3) is None:
+        return False  # originals are never built
+    try:
+        with open(_manifest_path(name), "r", encoding="utf-8") as f:
+            return name in f.read().split()
+    except FileNotFoundError:
+        return False
+
+def _original_for(sha: str) -> Optional[pathlib.Path]:
+    shard = base_dir() / sha[:2] / sha[2:4]
+    for p in shard.glob(f"{sha}.*"):
+        m = NAME_RE.match(p.name)
+        if m and m.group(3) is None and ".thumb." not in p.name:
+            return p
+    return None
+
+def build_derivative(name: str) -> Optional[pathlib.Path]:
+    """Create the derivative `name` from its original. Returns its path, or None."""
+    import cv2
+
+    m = NAME_RE.match(name)
+    if not m:
+        return None
+    out = path_for(name)
+    if out.exists():
+        return out
+    src = _original_for(m.group(1))
+    img = cv2.imread(str(src)) if src else None
+    if img is None:
+        return None
+
+    if ".thumb." in name:
+        H, W = img.shape[:2]
+        scale = min(1.0, THUMB_MAX / float(max(H, W)))
+        if scale < 1.0:
+            img = cv2.resize(img, (max(1, int(W * scale)), max(1, int(H * scale))), interpolation=cv2.INTER_AREA)
+        params = [cv2.IMWRITE_WEBP_QUALITY, 80] if name.endswith(".webp") else [cv2.IMWRITE_JPEG_QUALITY, 85]
+    elif m.group(3):
+        x, y, w, h = (int(m.group(i)) for i in range(4, 8))
+        img = img[y:y+h, x:x+w]
+        if img.size == 0:
+            return None
+        params = [cv2.IMWRITE_JPEG_QUALITY, 90]
+    else:
+        return None
+
+    ok, buf = cv2.imencode(out.suffix, img, params)
+    if not ok:
+        return None
+    _write_atomic(out, buf.tobytes())
+    return out
+
+_JOBS: "queue.Queue[List[str]]" = queue.Queue()
+_WORKER: Optional[threading.Thread] = None
+_WORKER_LOCK = threading.Lock()
+
+def _worker_loop():
+    while True:
+        names = _JOBS.get()
+        for name in names:
+            try:
+                build_derivative(name)
+            except Exception as e:
+                print(f"[storage] derivative {name} failed: {type(e).__name__}: {e}")
+
+def enqueue_derivatives(key: str, boxes: Optional[Dict[str, List[Sequence[int]]]] = None) -> Dict[str, object]:
+    """
+    Queue a thumbnail plus one crop per bbox in `boxes` ({"plate": [...], "vehicle": [...]})
+    for the background worker. Returns their URLs right away.
+    """
+    global _WORKER
+    names = [thumb_name(key)]
+    crops: Dict[str, List[str]] = {}
+    new_crops: List[str] = []
+    for kind, bbs in (boxes or {}).items():
+        if kind not in CROP_KINDS:
+            continue
+        for bb in bbs:
+            if bb and len(bb) >= 4:
+                n = crop_name(key, kind, bb)
+                names.append(n)
+                new_crops.append(n)
+                crops.setdefault(kind, []).append(url_for(n))
+    _register(key, new_crops)
+    with _WORKER_LOCK:
+        if _WORKER is None or not _WORKER.is_alive():
+            _WORKER = threading.Thread(target=_worker_loop, name="storage-derivatives", daemon=True)
+            _WORKER.start()
+    _JOBS.put(names)
+    return {"thumb_url": url_for(names[0]), "crop_urls": crops}
@@ -0,0 +1,140 @@
+"""
+OpenCV plate-candidate generation: the old per-contour Python loop (copied
+below as the baseline) vs alpr.pipeline._candidate_boxes (bounding rects of
+all outer contours in one pass, vectorized filter, NMS), also run with NMS
+disabled to show how many OCR runs the suppression alone saves.
+
+Reports, per implementation: candidate boxes (= Tesseract runs per image),
+candidate-generation time, and end-to-end time including OCR of every
+candidate. OCR is optional (--no-ocr) for machines without Tesseract.
+
+Without --images, synthetic frames alternate between a bordered plate (its
+characters are nested blobs, one candidate either way) and a plate in an
+open holder, where the holder and the plate text are separate outer blobs
+and the legacy code OCRs the same plate twice.
+
+    python bench/alpr_candidates.py --images path/to/lot_photos
+"""
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import pathlib
+from typing import List, Tuple, Dict, Any
+
+import numpy as np
+import cv2
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from alpr import pipeline  # noqa: E402
+
+def _legacy_candidate_boxes(img: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    closed = pipeline._preprocess(img)
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    H, W = img.shape[:2]
+    boxes: List[Tuple[int, int, int, int]] = []
+    for c in contours:
+        x, y, w, h = cv2.boundingRect(c)
+        area = w * h
+        if area < (W * H) * 0.004:
+            continue
+        ar = w / float(h) if h else 0
+        if ar < 1.5 or ar > 7.0:
+            continue
+        pad_x = int(w * 0.08)
+        pad_y = int(h * 0.20)
+        x0 = max(0, x - pad_x)
+        y0 = max(0, y - pad_y)
+        x1 = min(W, x + w + pad_x)
+        y1 = min(H, y + h + pad_y)
+        boxes.append((x0, y0, x1 - x0, y1 - y0))
+    if not boxes:
+        boxes = [(0, 0, W, H)]
+    cx, cy = W / 2, H / 2
+    boxes.sort(key=lambda b: (-(b[2]*b[3]), ((b[0]+b[2]/2-cx)**2+(b[1]+b[3]/2-cy)**2)**0.5))
+    return boxes[:5]
+
+def _images(images: str, n: int) -> List[Tuple[str, np.ndarray]]:
+    if images:
+        paths = sorted(
+            p for ext in ("*.jpg", "*.jpeg", "*.png")
+            for p in glob.glob(os.path.join(images, "**", ext), recursive=True)
+        )[:n]
+        return [(p, img) for p, img in ((p, cv2.imread(p)) for p in paths) if img is not None]
+    out = []
+    for i in range(n):
+        img = np.full((720, 1280, 3), 110, dtype=np.uint8)
+        if i % 2:
+            # plate in a holder open at the top: the holder doesn't enclose the
+            # plate, so both are outer blobs whose padded boxes overlap
+            cv2.rectangle(img, (500, 420), (780, 500), (200, 200, 200), -1)
+            cv2.polylines(img, [np.array([[484, 404], [484, 516], [796, 516], [796, 404]])], False, (20, 20, 20), 4)
+        else:
+            # plate with a border: characters and border are blobs nested inside it
+            cv2.rectangle(img, (500, 420), (780, 500), (255, 255, 255), -1)
+            cv2.rectangle(img, (506, 426), (774, 494), (20, 20, 20), 3)
+        cv2.putText(img, f"ABC{1000 + i}", (520, 480), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (0, 0, 0), 4)
+        out.append((f"synthetic-{i}", img))
+    return out
+
+def _bench(fn, frames, ocr: bool) -> Dict[str, Any]:
+    gen_ms, e2e_ms, counts = [], [], []
+    for _, img in frames:
+        t = time.perf_counter()
+        boxes = fn(img)
+        gen_ms.append((time.perf_counter() - t) * 1000.0)
+        if ocr:
+            for (x, y, w, h) in boxes:
+                pipeline._ocr_plate(img[y:y+h, x:x+w])
+        e2e_ms.append((time.perf_counter() - t) * 1000.0)
+        counts.append(len(boxes))
+    return {
+        "ocr_calls_mean": round(float(np.mean(counts)), 2),
+        "ocr_calls_total": int(sum(counts)),
+        "candidates_ms_mean": round(float(np.mean(gen_ms)), 2),
+        "end_to_end_ms_mean": round(float(np.mean(e2e_ms)), 1) if ocr else None,
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--images", default="")
+    ap.add_argument("--n", type=int, default=50)
+    ap.add_argument("--no-ocr", action="store_true")
+    ap.add_argument("--out", default="")
+    args = ap.parse_args()
+
+    frames = _images(args.images, args.n)
+    if not frames:
+        raise SystemExit("no images")
+    ocr = not args.no_ocr
+
+    legacy = _bench(_legacy_candidate_boxes, frames, ocr)
+    current = _bench(pipeline._candidate_boxes, frames, ocr)
+    nms = pipeline._nms
+    pipeline._nms = lambda boxes, *a, **kw: np.arange(len(boxes))
+    try:
+        no_nms = _bench(pipeline._candidate_boxes, frames, ocr)
+    finally:
+        pipeline._nms = nms
+    report = {
+        "images": args.images or "synthetic",
+        "n": len(frames),
+        "legacy_contours": legacy,
+        "vectorized_no_nms": no_nms,
+        "vectorized_nms": current,
+        "ocr_calls_saved": legacy["ocr_calls_total"] - current["ocr_calls_total"],
+        "ocr_calls_saved_by_nms": no_nms["ocr_calls_total"] - current["ocr_calls_total"],
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Full-frame plate search vs vehicle-then-plate cascade (ALPR_CASCADE).
+
+For every image both paths run through alpr.pipeline.recognize_plates and
+the script reports Tesseract calls, end-to-end latency (vehicle detection
+included for the cascade) and how many plates each path returned.
+
+    python bench/alpr_cascade.py --images path/to/lot_photos --out bench_cascade.json
+
+Without --images a few synthetic frames are drawn; the COCO detector will not
+find vehicles in them, so they only exercise the cascade's full-frame fallback.
+Use real lot photos for meaningful numbers.
+"""
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import pathlib
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+import cv2
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from alpr import pipeline  # noqa: E402
+
+# ---------- OCR call counter ----------
+_OCR_CALLS = 0
+_ocr_plate = pipeline._ocr_plate
+
+def _counting_ocr(crop):
+    global _OCR_CALLS
+    _OCR_CALLS += 1
+    return _ocr_plate(crop)
+
+pipeline._ocr_plate = _counting_ocr
+
+# ---------- images ----------
+def _synthetic(n: int, seed: int = 0) -> List[Tuple[str, np.ndarray]]:
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in range(n):
+        img = np.full((720, 1280, 3), 90, dtype=np.uint8)
+        # distractors: stripes and a sign
+        for x in range(0, 1280, 160):
+            cv2.line(img, (x, 600), (x + 60, 720), (230, 230, 230), 6)
+        cv2.rectangle(img, (1050, 60), (1240, 140), (255, 255, 255), -1)
+        cv2.putText(img, "EXIT 24", (1065, 118), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (0, 0, 0), 3)
+        for cx in (300, 800):
+            cv2.rectangle(img, (cx - 180, 300), (cx + 180, 560), tuple(int(c) for c in rng.integers(0, 255, 3)), -1)
+            cv2.rectangle(img, (cx - 70, 480), (cx + 70, 525), (255, 255, 255), -1)
+            text = "".join(rng.choice(list("ABCDEFGHJKLMNPRSTUVWXYZ"), 3)) + "".join(rng.choice(list("0123456789"), 4))
+            cv2.putText(img, text, (cx - 64, 515), cv2.FONT_HERSHEY_SIMPLEX, 0.95, (0, 0, 0), 2)
+        out.append((f"synthetic-{i}", img))
+    return out
+
+def _load(images: str, n: int) -> List[Tuple[str, np.ndarray]]:
+    if not images:
+        return _synthetic(n)
+    paths = sorted(
+        p for ext in ("*.jpg", "*.jpeg", "*.png")
+        for p in glob.glob(os.path.join(images, "**", ext), recursive=True)
+    )[:n]
+    return [(p, img) for p, img in ((p, cv2.imread(p)) for p in paths) if img is not None]
+
+def _run(img: np.ndarray, cascade: bool) -> Dict[str, Any]:
+    global _OCR_CALLS
+    _OCR_CALLS = 0
+    t = time.perf_counter()
+    dets = pipeline.recognize_plates(img, cascade=cascade)
+    return {"ms": (time.perf_counter() - t) * 1000.0, "ocr_calls": _OCR_CALLS, "plates": len(dets)}
+
+def _summary(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    ms = [r["ms"] for r in rows]
+    return {
+        "ocr_calls_mean": round(float(np.mean([r["ocr_calls"] for r in rows])), 2),
+        "ocr_calls_total": int(sum(r["ocr_calls"] for r in rows)),
+        "latency_ms_mean": round(float(np.mean(ms)), 1),
+        "latency_ms_p50": round(float(np.percentile(ms, 50)), 1),
+        "latency_ms_p95": round(float(np.percentile(ms, 95)), 1),
+        "plates_total": int(sum(r["plates"] for r in rows)),
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--images", default="")
+    ap.add_argument("--n", type=int, default=50)
+    ap.add_argument("--out", default="")
+    args = ap.parse_args()
+
+    frames = _load(args.images, args.n)
+    if not frames:
+        raise SystemExit("no images")
+
+    # load models outside the timed region
+    _run(frames[0][1], cascade=False)
+    _run(frames[0][1], cascade=True)
+
+    per_image = []
+    for name, img in frames:
+        per_image.append({"image": name, "full": _run(img, False), "cascade": _run(img, True)})
+
+    report = {
+        "images": args.images or "synthetic",
+        "n": len(frames),
+        "full_frame": _summary([r["full"] for r in per_image]),
+        "cascade": _summary([r["cascade"] for r in per_image]),
+        "per_image": per_image,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(json.dumps({k: v for k, v in report.items() if k != "per_image"}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Compare CLIP embedder backends (torch fp32 / onnx fp32 / onnx int8) on CPU.
+
+For every backend a fresh subprocess is started (so peak RSS is not shared),
+which reports model load time, single-crop latency, batched throughput and
+peak RSS, and dumps its embeddings. The parent then reports the cosine
+similarity of each backend's embeddings against torch fp32, plus how often
+the nearest neighbour within the sample set stays the same.
+
+    python bench/embedder_backends.py --images backend/uploads --n 64
+    python bench/embedder_backends.py --out bench_embedder.json
+
+Without --images, seeded synthetic "vehicle" crops are used.
+"""
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import pathlib
+import resource
+import subprocess
+import tempfile
+from typing import List, Dict, Any
+
+import numpy as np
+import cv2
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+# ---------- sample set ----------
+def _synthetic_crops(n: int, seed: int = 0) -> List[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    out = []
+    for _ in range(n):
+        h, w = int(rng.integers(120, 360)), int(rng.integers(180, 520))
+        img = np.full((h, w, 3), rng.integers(40, 220, size=3), dtype=np.uint8)
+        # body, windows, wheels, plate
+        color = tuple(int(c) for c in rng.integers(0, 255, size=3))
+        cv2.rectangle(img, (w // 10, h // 3), (9 * w // 10, 4 * h // 5), color, -1)
+        cv2.rectangle(img, (w // 4, h // 6), (3 * w // 4, h // 3), (60, 60, 60), -1)
+        for cx in (w // 4, 3 * w // 4):
+            cv2.circle(img, (cx, 4 * h // 5), max(4, h // 10), (20, 20, 20), -1)
+        cv2.rectangle(img, (2 * w // 5, 3 * h // 5), (3 * w // 5, 7 * h // 10), (235, 235, 235), -1)
+        noise = rng.normal(0, 8, size=img.shape)
+        out.append(np.clip(img + noise, 0, 255).astype(np.uint8))
+    return out
+
+def _load_crops(images: str, n: int) -> List[np.ndarray]:
+    if not images:
+        return _synthetic_crops(n)
+    paths = sorted(
+        p for ext in ("*.jpg", "*.jpeg", "*.png", "*.webp")
+        for p in glob.glob(os.path.join(images, "**", ext), recursive=True)
+    )[:n]
+    crops = [c for c in (cv2.imread(p) for p in paths) if c is not None]
+    if not crops:
+        raise SystemExit(f"no readable images under {images}")
+    return crops
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+# ---------- worker (one backend per process) ----------
+def _worker(args) -> None:
+    os.environ["EMBED_BACKEND"] = args.backend
+    from carid import embedder
+
+    crops = _load_crops(args.images, args.n)
+
+    t0 = time.perf_counter()
+    embedder.dim()  # forces model/session load
+    load_s = time.perf_counter() - t0
+
+    for c in crops[: args.warmup]:
+        embedder.embed_bgr_image(c)
+
+    lat_ms = []
+    vecs = []
+    for c in crops:
+        t = time.perf_counter()
+        vecs.append(embedder.embed_bgr_image(c))
+        lat_ms.append((time.perf_counter() - t) * 1000.0)
+
+    t = time.perf_counter()
+    for i in range(0, len(crops), args.batch):
+        embedder.embed_bgr_images(crops[i:i + args.batch])
+    batch_s = time.perf_counter() - t
+
+    np.save(args.dump, np.vstack(vecs).astype(np.float32))
+    print(json.dumps({
+        "backend": args.backend,
+        "n": len(crops),
+        "load_s": round(load_s, 3),
+        "latency_ms_p50": round(float(np.percentile(lat_ms, 50)), 2),
+        "latency_ms_p95": round(float(np.percentile(lat_ms, 95)), 2),
+        "throughput_single_per_s": round(len(crops) / (sum(lat_ms) / 1000.0), 2),
+        "throughput_batched_per_s": round(len(crops) / batch_s, 2),
+        "batch": args.batch,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }))
+
+# ---------- parent ----------
+def _run(cmd: List[str]) -> str:
+    res = subprocess.run(cmd, capture_output=True, text=True)
+    if res.returncode != 0:
+        sys.stderr.write(res.stderr)
+        raise SystemExit(f"benchmark step failed: {' '.join(cmd)}")
+    return res.stdout
+
+def _accuracy(ref: np.ndarray, got: np.ndarray) -> Dict[str, Any]:
+    cos = np.sum(ref * got, axis=1)
+    # nearest neighbour (excluding self) within the sample set
+    def nn(m):
+        s = m @ m.T
+        np.fill_diagonal(s, -np.inf)
+        return np.argmax(s, axis=1)
+    agree = float(np.mean(nn(ref) == nn(got))) if ref.shape[0] > 1 else 1.0
+    return {
+        "cosine_vs_fp32_mean": round(float(cos.mean()), 5),
+        "cosine_vs_fp32_min": round(float(cos.min()), 5),
+        "cosine_vs_fp32_p5": round(float(np.percentile(cos, 5)), 5),
+        "nn_agreement_vs_fp32": round(agree, 4),
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--images", default="", help="directory of sample crops (default: synthetic)")
+    ap.add_argument("--n", type=int, default=64)
+    ap.add_argument("--batch", type=int, default=8)
+    ap.add_argument("--warmup", type=int, default=3)
+    ap.add_argument("--backends", default=",".join(BACKENDS))
+    ap.add_argument("--out", default="", help="write JSON report here (default: stdout)")
+    ap.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--export", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--backend", default="torch", help=argparse.SUPPRESS)
+    ap.add_argument("--dump", default="", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.export:
+        from carid import embedder
+        embedder.export_onnx()
+        return
+    if args.worker:
+        _worker(args)
+        return
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "torch" not in backends:
+        backends.insert(0, "torch")  # fp32 reference for the accuracy check
+    me = [sys.executable, os.path.abspath(__file__)]
+
+    if any(b.startswith("onnx") for b in backends):
+        # export once up front so the onnx workers never import torch
+        _run(me + ["--export"])
+
+    report: Dict[str, Any] = {"images": args.images or "synthetic", "results": []}
+    dumps: Dict[str, np.ndarray] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for b in backends:
+            dump = os.path.join(tmp, f"{b}.npy")
+            out = _run(me + [
+                "--worker", "--backend", b, "--dump", dump,
+                "--images", args.images, "--n", str(args.n),
+                "--batch", str(args.batch), "--warmup", str(args.warmup),
+            ])
+            report["results"].append(json.loads(out.strip().splitlines()[-1]))
+            dumps[b] = np.load(dump)
+
+    for r in report["results"]:
+        r.update(_accuracy(dumps["torch"], dumps[r["backend"]]))
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
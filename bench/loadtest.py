@@ -0,0 +1,418 @@
+"""
+End-to-end load test for the ParkTrack API.
+
+Drives POST /api/v1/upload-image, /api/v1/reid/identify-cars,
+/api/v1/reid/enroll-car and GET /api/v1/history/{plate},
+/api/v1/plates/{plate} with synthetic JPEGs, and writes one JSON report
+(throughput, p50/p95/p99 latency, error rate per endpoint, server CPU/RSS,
+optional Postgres container stats) that can be diffed across commits and
+worker/pool settings. The client only needs the standard library + numpy/cv2.
+
+Open loop (--rate > 0): requests arrive at the given rate (Poisson or
+constant) regardless of how fast the server answers; latency is measured from
+the scheduled arrival, so queueing is not hidden. Closed loop (--rate 0):
+--concurrency clients send back-to-back.
+
+    # DB: docker compose -f infra/docker-compose.yml up -d ; psql ... -f db/schema.sql
+    python bench/loadtest.py --start-server --workers 2 --stub-models \\
+        --rate 20 --duration 60 --mix upload=4,identify=2,enroll=1,history=2,plates=1 \\
+        --label "2 workers, pool 5" --out loadtest.json
+    python bench/loadtest.py --url http://127.0.0.1:8000 --server-pid 12345 ...
+
+--stub-models starts the server with PARKTRACK_STUB_MODELS=1 (no YOLO/OCR/CLIP)
+to isolate API and DB overhead. DB_POOL_SIZE / DB_MAX_OVERFLOW / DATABASE_URL
+are passed through from the environment.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import random
+import signal
+import argparse
+import pathlib
+import threading
+import subprocess
+import http.client
+import urllib.parse
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import cv2
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+OPS = ("upload", "identify", "enroll", "history", "plates")
+
+# ---------- synthetic images ----------
+def _make_images(n: int, size: Tuple[int, int], seed: int) -> List[bytes]:
+    rng = np.random.default_rng(seed)
+    W, H = size
+    out = []
+    for i in range(n):
+        img = np.full((H, W, 3), rng.integers(60, 160, size=3), dtype=np.uint8)
+        cx, cy = W // 2, int(H * 0.6)
+        color = tuple(int(c) for c in rng.integers(0, 255, size=3))
+        cv2.rectangle(img, (cx - W // 4, cy - H // 5), (cx + W // 4, cy + H // 6), color, -1)
+        cv2.rectangle(img, (cx - W // 16, cy + H // 12), (cx + W // 16, cy + H // 7), (250, 250, 250), -1)
+        cv2.putText(img, f"LT{i:05d}", (cx - W // 18, cy + H // 8), cv2.FONT_HERSHEY_SIMPLEX,
+                    W / 1600.0, (0, 0, 0), 2)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        out.append(buf.tobytes())
+    return out
+
+def _unique(jpeg: bytes) -> bytes:
+    # bytes after the JPEG EOI marker are ignored by decoders but change the content hash
+    return jpeg + uuid.uuid4().bytes
+
+# ---------- HTTP ----------
+def _multipart(fields: Dict[str, str], data: bytes) -> Tuple[bytes, str]:
+    b = uuid.uuid4().hex
+    parts = [
+        f'--{b}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode()
+        for k, v in fields.items()
+    ]
+    parts.append(
+        f'--{b}\r\nContent-Disposition: form-data; name="file"; filename="car.jpg"\r\n'
+        f"Content-Type: image/jpeg\r\n\r\n".encode() + data + b"\r\n"
+    )
+    parts.append(f"--{b}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={b}"
+
+class _Client:
+    """One keep-alive connection per worker thread."""
+    def __init__(self, base: str, timeout: float):
+        u = urllib.parse.urlparse(base)
+        self.host, self.port = u.hostname, u.port or 80
+        self.timeout = timeout
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=body, headers=headers or {})
+                resp = self.conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        raise RuntimeError("unreachable")
+
+# ---------- workload ----------
+class Workload:
+    def __init__(self, args, images: List[bytes]):
+        self.args = args
+        self.images = images
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.plates = [f"LT{i:05d}" for i in range(args.plates)]
+        self.known: List[str] = []  # plates the API has seen (for GETs)
+
+    def pick(self) -> Tuple[str, int]:
+        with self.lock:
+            i = self.rng.randrange(len(self.images))
+            return self.plates[i % len(self.plates)], i
+
+    def remember(self, plate: str):
+        with self.lock:
+            if len(self.known) < 10000:
+                self.known.append(plate)
+
+    def known_plate(self) -> str:
+        with self.lock:
+            return self.rng.choice(self.known) if self.known else self.plates[0]
+
+    def run(self, client: _Client, op: str) -> int:
+        lot = self.rng.choice("ABC")
+        if op in ("upload", "identify", "enroll"):
+            plate, i = self.pick()
+            data = _unique(self.images[i]) if self.args.unique_images else self.images[i]
+            if op == "upload":
+                path, fields = "/api/v1/upload-image", {"lot": lot}
+            elif op == "identify":
+                path, fields = "/api/v1/reid/identify-cars", {"lot": lot, "topk": "3"}
+            else:
+                path, fields = "/api/v1/reid/enroll-car", {"plate": plate, "car_model": "loadtest"}
+            body, ctype = _multipart(fields, data)
+            status, payload = client.request("POST", path, body, {"Content-Type": ctype})
+            if status == 200 and op == "upload":
+                try:
+                    for d in json.loads(payload).get("detections", []):
+                        self.remember(d["plate"])
+                except ValueError:
+                    pass
+            elif status == 200 and op == "enroll":
+                self.remember(plate)
+            return status
+        plate = self.known_plate()
+        path = f"/api/v1/history/{plate}" if op == "history" else f"/api/v1/plates/{plate}"
+        status, _ = client.request("GET", path)
+        return status
+
+def _parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        op, _, w = part.partition("=")
+        op = op.strip()
+        if op not in OPS:
+            raise SystemExit(f"unknown op '{op}' in --mix (choose from {OPS})")
+        mix.append((op, float(w or 1)))
+    return mix
+
+# ---------- server resource sampling (/proc, Linux) ----------
+def _descendants(pid: int) -> List[int]:
+    children: Dict[int, List[int]] = {}
+    for d in os.listdir("/proc"):
+        if not d.isdigit():
+            continue
+        try:
+            with open(f"/proc/{d}/stat", "r") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(d))
+    out, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        out.append(p)
+        stack.extend(children.get(p, []))
+    return out
+
+def _proc_sample(pid: int) -> Tuple[float, float]:
+    """(cpu seconds, rss MB) summed over pid and its descendants."""
+    tick = os.sysconf("SC_CLK_TCK")
+    cpu = rss = 0.0
+    for p in _descendants(pid):
+        try:
+            with open(f"/proc/{p}/stat", "r") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / tick
+            with open(f"/proc/{p}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1]) / 1024.0
+        except (OSError, IndexError, ValueError):
+            continue
+    return cpu, rss
+
+class _Sampler(threading.Thread):
+    def __init__(self, pid: Optional[int], container: str, interval: float):
+        super().__init__(daemon=True)
+        self.pid, self.container, self.interval = pid, container, interval
+        self.stop = threading.Event()
+        self.cpu_pct: List[float] = []
+        self.rss_mb: List[float] = []
+        self.db: List[Dict[str, str]] = []
+
+    def run(self):
+        last = _proc_sample(self.pid) if self.pid and os.path.isdir("/proc") else None
+        last_t = time.monotonic()
+        while not self.stop.wait(self.interval):
+            if last is not None:
+                cpu, rss = _proc_sample(self.pid)
+                now = time.monotonic()
+                self.cpu_pct.append(100.0 * (cpu - last[0]) / (now - last_t))
+                self.rss_mb.append(rss)
+                last, last_t = (cpu, rss), now
+            if self.container:
+                try:
+                    out = subprocess.run(
+                        ["docker", "stats", "--no-stream", "--format", "{{json .}}", self.container],
+                        capture_output=True, text=True, timeout=10,
+                    ).stdout.strip()
+                    if out:
+                        self.db.append(json.loads(out))
+                except (OSError, subprocess.TimeoutExpired, ValueError):
+                    pass
+
+    def report(self) -> Dict[str, Any]:
+        rep: Dict[str, Any] = {}
+        if self.cpu_pct:
+            rep["server"] = {
+                "cpu_pct_mean": round(float(np.mean(self.cpu_pct)), 1),
+                "cpu_pct_max": round(float(np.max(self.cpu_pct)), 1),
+                "rss_mb_mean": round(float(np.mean(self.rss_mb)), 1),
+                "rss_mb_max": round(float(np.max(self.rss_mb)), 1),
+            }
+        if self.db:
+            rep["db_container"] = {"samples": len(self.db), "last": self.db[-1],
+                                   "cpu_pct_max": max(float(d.get("CPUPerc", "0%").rstrip("%") or 0) for d in self.db)}
+        return rep
+
+# ---------- runner ----------
+def _stats(rows: List[Tuple[str, float, float, int]], wall: float) -> Dict[str, Any]:
+    lat = [r[1] for r in rows]
+    svc = [r[2] for r in rows]
+    codes: Dict[str, int] = {}
+    for r in rows:
+        codes[str(r[3])] = codes.get(str(r[3]), 0) + 1
+    errors = sum(1 for r in rows if r[3] == 0 or r[3] >= 500)
+    client_errors = sum(1 for r in rows if 400 <= r[3] < 500)
+    pct = (lambda a, q: round(float(np.percentile(a, q)), 1) if a else None)
+    return {
+        "requests": len(rows),
+        "throughput_rps": round(len(rows) / wall, 2) if wall else None,
+        "error_rate": round(errors / len(rows), 4) if rows else None,
+        "client_error_rate": round(client_errors / len(rows), 4) if rows else None,
+        "latency_ms": {"p50": pct(lat, 50), "p95": pct(lat, 95), "p99": pct(lat, 99),
+                       "max": round(max(lat), 1) if lat else None},
+        "service_ms": {"p50": pct(svc, 50), "p95": pct(svc, 95), "p99": pct(svc, 99)},
+        "status_codes": codes,
+    }
+
+def _run(args, workload: Workload, mix: List[Tuple[str, float]]) -> Tuple[List, float]:
+    ops, weights = zip(*mix)
+    rng = random.Random(args.seed + 1)
+    rows: List[Tuple[str, float, float, int]] = []
+    rows_lock = threading.Lock()
+    jobs: "queue.Queue[Optional[Tuple[str, float]]]" = queue.Queue()
+    t_end = time.monotonic() + args.duration
+
+    def worker():
+        client = _Client(args.url, args.timeout)
+        while True:
+            if args.rate > 0:
+                job = jobs.get()
+                if job is None:
+                    return
+                op, scheduled = job
+            else:
+                if time.monotonic() >= t_end:
+                    return
+                op, scheduled = rng.choices(ops, weights)[0], time.monotonic()
+            sent = time.monotonic()
+            try:
+                status = workload.run(client, op)
+            except Exception:
+                status = 0
+                client.conn = None
+            done = time.monotonic()
+            with rows_lock:
+                rows.append((op, (done - scheduled) * 1000.0, (done - sent) * 1000.0, status))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+    t0 = time.monotonic()
+    for t in threads:
+        t.start()
+    if args.rate > 0:
+        nxt = t0
+        while nxt < t_end:
+            delay = nxt - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            jobs.put((rng.choices(ops, weights)[0], nxt))
+            gap = rng.expovariate(args.rate) if args.arrival == "poisson" else 1.0 / args.rate
+            nxt += gap
+        for _ in threads:
+            jobs.put(None)
+    for t in threads:
+        t.join()
+    return rows, time.monotonic() - t0
+
+def _start_server(args) -> subprocess.Popen:
+    env = dict(os.environ)
+    if args.stub_models:
+        env["PARKTRACK_STUB_MODELS"] = "1"
+    port = urllib.parse.urlparse(args.url).port or 8000
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+           "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=str(REPO_ROOT / "backend"), env=env, start_new_session=True)
+    client = _Client(args.url, 2.0)
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with code {proc.returncode}")
+        try:
+            if client.request("GET", "/health")[0] == 200:
+                return proc
+        except OSError:
+            client.conn = None
+        time.sleep(0.5)
+    os.killpg(proc.pid, signal.SIGTERM)
+    raise SystemExit("server did not become healthy in time")
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(REPO_ROOT),
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--duration", type=float, default=60.0, help="seconds")
+    ap.add_argument("--warmup", type=float, default=5.0, help="seconds of load before measuring")
+    ap.add_argument("--rate", type=float, default=10.0, help="arrivals/s; 0 = closed loop")
+    ap.add_argument("--arrival", choices=("poisson", "constant"), default="poisson")
+    ap.add_argument("--concurrency", type=int, default=16, help="client threads (max in-flight)")
+    ap.add_argument("--mix", default="upload=4,identify=2,enroll=1,history=2,plates=1")
+    ap.add_argument("--images", type=int, default=64, help="distinct synthetic images")
+    ap.add_argument("--image-size", default="1280x720")
+    ap.add_argument("--plates", type=int, default=200)
+    ap.add_argument("--unique-images", action=argparse.BooleanOptionalAction, default=True,
+                    help="make every upload byte-unique (defeats content-hash dedupe)")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--start-server", action="store_true", help="launch uvicorn from backend/")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--stub-models", action="store_true", help="server runs with PARKTRACK_STUB_MODELS=1")
+    ap.add_argument("--startup-timeout", type=float, default=120.0)
+    ap.add_argument("--server-pid", type=int, default=0, help="sample CPU/RSS of this pid + children")
+    ap.add_argument("--db-container", default="", help="also sample `docker stats` (e.g. parktrack-postgres)")
+    ap.add_argument("--sample-interval", type=float, default=1.0)
+    ap.add_argument("--label", default="", help="free text stored in the report (settings under test)")
+    ap.add_argument("--out", default="")
+    args = ap.parse_args()
+
+    W, H = (int(v) for v in args.image_size.lower().split("x"))
+    mix = _parse_mix(args.mix)
+    workload = Workload(args, _make_images(args.images, (W, H), args.seed))
+
+    proc = _start_server(args) if args.start_server else None
+    pid = proc.pid if proc else args.server_pid
+    try:
+        if args.warmup > 0:
+            duration, args.duration = args.duration, args.warmup
+            _run(args, workload, mix)
+            args.duration = duration
+        sampler = _Sampler(pid or None, args.db_container, args.sample_interval)
+        sampler.start()
+        rows, wall = _run(args, workload, mix)
+        sampler.stop.set()
+        sampler.join()
+    finally:
+        if proc:
+            os.killpg(proc.pid, signal.SIGTERM)
+            proc.wait(timeout=30)
+
+    report: Dict[str, Any] = {
+        "label": args.label,
+        "git_rev": _git_rev(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "url": args.url, "duration_s": args.duration, "rate": args.rate, "arrival": args.arrival,
+            "concurrency": args.concurrency, "mix": dict(mix), "image_size": [W, H],
+            "workers": args.workers if args.start_server else None, "stub_models": args.stub_models,
+            "db_pool_size": os.getenv("DB_POOL_SIZE"), "db_max_overflow": os.getenv("DB_MAX_OVERFLOW"),
+        },
+        "overall": _stats(rows, wall),
+        "endpoints": {op: _stats([r for r in rows if r[0] == op], wall) for op, _ in mix},
+        "resources": sampler.report(),
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
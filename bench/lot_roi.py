@@ -0,0 +1,129 @@
+"""
+Full-frame vs ROI-restricted processing for a fixed camera (LOT_CONFIG).
+
+For one lot's geometry the script reports the fraction of frame pixels the
+ROI keeps (bounding rects actually fed to the models, and the polygon area
+itself), then times vehicle detection (carid.detector) and plate recognition
+(alpr.pipeline) on every image with and without the ROI, including how many
+Tesseract calls each made.
+
+    python bench/lot_roi.py --config backend/config/lots.json --lot A --images path/to/camera_A
+
+Without --config the example geometry (backend/config/lots.example.json, a
+pentagon with no edge on its bounding rect, so the crop border never hides
+the polygon) is used; without --images synthetic 1920x1080 frames are drawn
+with one plate inside the ROI and clutter outside it, so "plates_roi" should
+report one result per frame.
+"""
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import pathlib
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+import cv2
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "backend"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from alpr import pipeline  # noqa: E402
+from app.lot_config import LotGeometry  # noqa: E402
+
+# ---------- OCR call counter ----------
+_OCR_CALLS = 0
+_ocr_plate = pipeline._ocr_plate
+
+def _counting_ocr(crop):
+    global _OCR_CALLS
+    _OCR_CALLS += 1
+    return _ocr_plate(crop)
+
+pipeline._ocr_plate = _counting_ocr
+
+def _images(images: str, n: int) -> List[Tuple[str, np.ndarray]]:
+    if images:
+        paths = sorted(
+            p for ext in ("*.jpg", "*.jpeg", "*.png")
+            for p in glob.glob(os.path.join(images, "**", ext), recursive=True)
+        )[:n]
+        return [(p, img) for p, img in ((p, cv2.imread(p)) for p in paths) if img is not None]
+    # synthetic: a plate inside the example ROI and sky/building clutter above it
+    rng = np.random.default_rng(0)
+    out = []
+    for i in range(n):
+        img = np.full((1080, 1920, 3), 110, dtype=np.uint8)
+        for _ in range(12):
+            x, y = int(rng.integers(0, 1800)), int(rng.integers(0, 380))
+            cv2.rectangle(img, (x, y), (x + 110, y + 35), (240, 240, 240), -1)
+        cv2.rectangle(img, (820, 840), (1100, 920), (255, 255, 255), -1)
+        cv2.putText(img, f"ABC{1000 + i}", (840, 900), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (0, 0, 0), 4)
+        out.append((f"synthetic-{i}", img))
+    return out
+
+def _time(fn, frames) -> Dict[str, Any]:
+    global _OCR_CALLS
+    _OCR_CALLS = 0
+    ms, found = [], []
+    for _, img in frames:
+        t = time.perf_counter()
+        res = fn(img)
+        ms.append((time.perf_counter() - t) * 1000.0)
+        found.append(len(res))
+    return {
+        "ms_mean": round(float(np.mean(ms)), 1),
+        "ms_p95": round(float(np.percentile(ms, 95)), 1),
+        "results_total": int(sum(found)),
+        "ocr_calls_total": _OCR_CALLS,
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--config", default=str(REPO_ROOT / "backend" / "config" / "lots.example.json"))
+    ap.add_argument("--lot", default="A")
+    ap.add_argument("--images", default="")
+    ap.add_argument("--n", type=int, default=20)
+    ap.add_argument("--no-detector", action="store_true", help="skip the YOLO vehicle-detector timings")
+    ap.add_argument("--out", default="")
+    args = ap.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = {str(k).upper(): v for k, v in json.load(f).items()}
+    if args.lot.upper() not in cfg:
+        raise SystemExit(f"lot {args.lot} not in {args.config}")
+    geom = LotGeometry(args.lot.upper(), cfg[args.lot.upper()])
+
+    frames = _images(args.images, args.n)
+    if not frames:
+        raise SystemExit("no images")
+    H, W = frames[0][1].shape[:2]
+    rect_px, poly_px = geom.roi_pixels(W, H)
+
+    report: Dict[str, Any] = {
+        "images": args.images or "synthetic",
+        "n": len(frames),
+        "frame": [W, H],
+        "roi_rect_fraction": round(rect_px / float(W * H), 3),
+        "roi_polygon_fraction": round(poly_px / float(W * H), 3),
+        "plates_full_frame": _time(lambda img: pipeline.recognize_plates(img), frames),
+        "plates_roi": _time(lambda img: pipeline.recognize_plates(img, roi=geom.crops), frames),
+    }
+    if not args.no_detector:
+        from carid import detector
+        detector.detect_vehicles(frames[0][1])  # load weights outside the timings
+        report["vehicles_full_frame"] = _time(lambda img: detector.detect_vehicles(img), frames)
+        report["vehicles_roi"] = _time(lambda img: detector.detect_vehicles(img, geom.crops(img)), frames)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
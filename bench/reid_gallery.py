@@ -0,0 +1,119 @@
+"""
+Per-plate gallery management in CarIndex on a synthetic enrollment stream.
+
+`--plates` identities are enrolled with a skewed number of enrollments each
+(a few popular cars enrolled hundreds of times). Each enrollment is a view
+of the car (unit vector around the plate's centre) and repeats of the same
+view come in near-identical bursts, like several frames of one visit.
+Configurations:
+  - unmanaged : every enrollment stored, per-vector results (old behaviour)
+  - managed   : dedup + max_per_plate exemplars, results collapsed per plate
+  - centroid  : managed + per-plate centroid first stage
+Reports stored vectors, meta.json size, plate recall@1, distinct plates in
+the top-5 and search latency per query.
+
+    python bench/reid_gallery.py --plates 2000 --out bench_gallery.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import pathlib
+import tempfile
+from typing import Dict, Any, List
+
+import numpy as np
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from carid.indexer import CarIndex  # noqa: E402
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+def _stream(n_plates: int, dim: int, noise: float, burst_noise: float, n_queries: int, seed: int):
+    rng = np.random.default_rng(seed)
+    centres = _unit(rng.standard_normal((n_plates, dim)))
+    # Zipf-like enrollment counts: plate 0 most popular
+    counts = np.maximum(1, (300.0 / np.arange(1, n_plates + 1) ** 0.8).astype(int))
+    vecs, metas = [], []
+    for p, c in enumerate(counts):
+        for _ in range(int(np.ceil(c / 4))):  # bursts of up to 4 near-identical frames
+            view = centres[p] + noise * rng.standard_normal(dim)
+            for _ in range(min(4, c)):
+                vecs.append(view + burst_noise * rng.standard_normal(dim))
+                metas.append({"plate": f"P{p:06d}", "owner_name": f"Owner {p}", "owner_contact": f"+1555{p:07d}",
+                              "car_model": "sedan", "notes": "bench", "image_url": f"/media/{p:064x}.jpg",
+                              "bbox": [0, 0, 100, 100]})
+    order = rng.permutation(len(vecs))
+    G = _unit(np.asarray(vecs)[order])
+    metas = [metas[i] for i in order]
+    q_plates = rng.integers(0, n_plates, size=n_queries)
+    Q = _unit(centres[q_plates] + noise * rng.standard_normal((n_queries, dim)))
+    return G, metas, Q, [f"P{p:06d}" for p in q_plates]
+
+def _bench(idx: CarIndex, Q: np.ndarray, truth: List[str], unique: bool) -> Dict[str, Any]:
+    t = time.perf_counter()
+    rows = [idx.search(Q[i:i + 1], k=5, unique_plates=unique)[0] for i in range(len(Q))]
+    ms = (time.perf_counter() - t) * 1000.0 / len(Q)
+    plates = [[m["meta"]["plate"] for m in row] for row in rows]
+    return {
+        "vectors": idx.stats()["vectors"],
+        "meta_json_bytes": os.path.getsize(idx.meta_path),
+        "plate_recall@1": round(float(np.mean([p[:1] == [t1] for p, t1 in zip(plates, truth)])), 4),
+        "distinct_plates_top5": round(float(np.mean([len(set(p)) for p in plates])), 2),
+        "search_ms_single": round(ms, 3),
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--plates", type=int, default=2000)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--noise", type=float, default=0.05, help="per-dimension noise between views")
+    ap.add_argument("--burst-noise", type=float, default=0.005, help="per-dimension noise within a burst")
+    ap.add_argument("--dedup", type=float, default=0.97)
+    ap.add_argument("--max-per-plate", type=int, default=8)
+    ap.add_argument("--centroid-probe", type=int, default=4)
+    ap.add_argument("--batch", type=int, default=256, help="enrollments per add() call")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="")
+    args = ap.parse_args()
+
+    G, metas, Q, truth = _stream(args.plates, args.dim, args.noise, args.burst_noise, args.queries, args.seed)
+    report: Dict[str, Any] = {"enrollments": len(G), "plates": args.plates, "results": {}}
+    configs = {
+        "unmanaged": (dict(dedup=None, max_per_plate=0), False),
+        "managed": (dict(dedup=args.dedup, max_per_plate=args.max_per_plate), True),
+        "centroid": (dict(dedup=args.dedup, max_per_plate=args.max_per_plate, centroid_probe=args.centroid_probe), True),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (kw, unique) in configs.items():
+            idx = CarIndex(os.path.join(tmp, name), args.dim, **kw)
+            t = time.perf_counter()
+            for i in range(0, len(G), args.batch):
+                idx.add(G[i:i + args.batch], metas[i:i + args.batch])
+            r = {"enroll_s": round(time.perf_counter() - t, 2)}
+            r.update(_bench(idx, Q, truth, unique))
+            report["results"][name] = r
+            print(f"[bench] {name}: {r}", file=sys.stderr)
+
+        # the same unmanaged gallery consolidated offline
+        idx = CarIndex(os.path.join(tmp, "unmanaged"), args.dim, dedup=args.dedup, max_per_plate=args.max_per_plate)
+        t = time.perf_counter()
+        stats = idx.compact()
+        r = {"compact_s": round(time.perf_counter() - t, 2), **stats}
+        r.update(_bench(idx, Q, truth, True))
+        report["results"]["compacted"] = r
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Compare CarIndex vector storages on a synthetic re-id gallery.
+
+The gallery is `--ids` identities with `--views` noisy views each (unit
+vectors around a random centre, roughly how CLIP crops of one car cluster).
+Queries are fresh views. The gallery is added in `--batch`-sized
+enrollments and, after each one, retrain() runs whenever training is due
+(what the background training thread does in production). For every
+storage, with and without exact re-ranking, reports:
+  - time spent in add() and, separately, in training
+  - bytes/vector in RAM (code + 8-byte id) and serialized index bytes/vector
+  - recall@1 / recall@5 against exact (flat) search
+  - how many vectors the codebooks were last trained on
+  - search latency per single query and per query in a batch
+
+    python bench/reid_index_storage.py --ids 5000 --views 4 --out bench_index.json
+
+OPQ is left out of the default --storages: learning its rotation takes
+minutes per training on a single core.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import pathlib
+import tempfile
+from typing import Dict, Any, List
+
+import numpy as np
+import faiss
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from carid.indexer import CarIndex, STORAGES  # noqa: E402
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+def _gallery(n_ids: int, views: int, n_queries: int, dim: int, noise: float, seed: int):
+    rng = np.random.default_rng(seed)
+    centres = _unit(rng.standard_normal((n_ids, dim)))
+    G = _unit(np.repeat(centres, views, axis=0) + noise * rng.standard_normal((n_ids * views, dim)))
+    q_ids = rng.integers(0, n_ids, size=n_queries)
+    Q = _unit(centres[q_ids] + noise * rng.standard_normal((n_queries, dim)))
+    return G, Q
+
+def _ids(results: List[List[Dict[str, Any]]]) -> List[List[int]]:
+    return [[m["id"] for m in row] for row in results]
+
+def _bench(idx: CarIndex, Q: np.ndarray, truth: List[int], k: int) -> Dict[str, Any]:
+    t = time.perf_counter()
+    single = [idx.search(Q[i:i + 1], k=k, unique_plates=False)[0] for i in range(len(Q))]
+    single_ms = (time.perf_counter() - t) * 1000.0 / len(Q)
+    t = time.perf_counter()
+    idx.search(Q, k=k, unique_plates=False)
+    batch_ms = (time.perf_counter() - t) * 1000.0 / len(Q)
+    got = _ids(single)
+    return {
+        "recall@1": round(float(np.mean([g[:1] == [t1] for g, t1 in zip(got, truth)])), 4),
+        "recall@5": round(float(np.mean([t1 in g[:5] for g, t1 in zip(got, truth)])), 4),
+        "search_ms_single": round(single_ms, 3),
+        "search_ms_batched": round(batch_ms, 4),
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--ids", type=int, default=5000)
+    ap.add_argument("--views", type=int, default=4)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--noise", type=float, default=0.05, help="per-dimension view noise")
+    ap.add_argument("--pq-m", type=int, default=64)
+    ap.add_argument("--rerank", type=int, default=4)
+    ap.add_argument("--storages", default=",".join(s for s in STORAGES if s != "opq"))
+    ap.add_argument("--batch", type=int, default=1000, help="vectors per add() call")
+    ap.add_argument("--train-min", type=int, default=None, help="override CarIndex's default")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="")
+    args = ap.parse_args()
+
+    G, Q = _gallery(args.ids, args.views, args.queries, args.dim, args.noise, args.seed)
+    metas = [{"plate": f"P{i // args.views:06d}"} for i in range(len(G))]
+    k = 5
+
+    report: Dict[str, Any] = {
+        "gallery": len(G), "queries": len(Q), "dim": args.dim,
+        "faiss_threads": faiss.omp_get_max_threads(), "results": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        truth: List[int] = []
+        for storage in [s.strip() for s in args.storages.split(",") if s.strip()]:
+            idx = CarIndex(os.path.join(tmp, storage), args.dim, storage=storage, pq_m=args.pq_m,
+                           train_min=args.train_min, dedup=None, max_per_plate=0, train_async=False)
+            add_s = train_s = 0.0
+            for i in range(0, len(G), args.batch):
+                t = time.perf_counter()
+                idx.add(G[i:i + args.batch], metas[i:i + args.batch])
+                t1 = time.perf_counter()
+                idx.retrain()
+                add_s += t1 - t
+                train_s += time.perf_counter() - t1
+            # rerank only changes the search, so both variants share one build
+            for rerank in ([1] if storage == "flat" else [1, args.rerank]):
+                idx.rerank = rerank
+                if not truth:
+                    exact = CarIndex(os.path.join(tmp, "truth"), args.dim, dedup=None, max_per_plate=0) if storage != "flat" else idx
+                    if exact is not idx:
+                        exact.add(G, metas)
+                    truth = [row[0] for row in _ids(exact.search(Q, k=1, unique_plates=False))]
+                r = {
+                    "storage": storage,
+                    "rerank": rerank,
+                    "add_s": round(add_s, 2),
+                    "train_s": round(train_s, 2),
+                    "index_kind": idx.meta.get("index_kind"),
+                    "trained_on": idx.meta.get("trained_on"),
+                    "ram_bytes_per_vector": idx.code_size() + 8,
+                    # flat writes no index.faiss: vectors.f32 is its on-disk form
+                    "index_file_bytes_per_vector": round(os.path.getsize(
+                        idx.index_path if os.path.exists(idx.index_path) else idx.vec_path) / len(G), 1),
+                }
+                r.update(_bench(idx, Q, truth, k))
+                report["results"].append(r)
+                print(f"[bench] {storage:5s} rerank={rerank}: {r}", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
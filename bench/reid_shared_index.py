@@ -0,0 +1,178 @@
+"""
+N worker processes serving one re-id gallery: private CarIndex per worker
+("local", the old behaviour) vs SharedCarIndex snapshots ("shared").
+
+Each worker (spawned, like uvicorn workers) opens the index, runs the same
+queries and reports a digest of its results plus memory from
+/proc/self/smaps_rollup (PSS splits shared pages between processes, so the
+sum over workers is the real total). In shared mode the parent then enrolls
+new vectors through the writer, and every worker must hot-swap to the new
+version and return identical results; the time that enrollment took
+(writer lock held, snapshot linked, published) is reported too.
+
+Exits non-zero if any worker's results differ (before or after the
+enrollment) or if shared mode uses more total PSS than local mode (5%
+tolerance for page-cache noise), so it can run as a check. Both modes
+memory-map vectors.f32 and the FAISS index, so the totals are expected to be
+close; what shared mode adds is one writer and identical answers everywhere.
+
+    python bench/reid_shared_index.py --workers 4 --gallery 50000
+    python bench/reid_shared_index.py --workers 4 --gallery 50000 --storage sq8
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import pathlib
+import tempfile
+import multiprocessing as mp
+from typing import Dict, Any, List
+
+import numpy as np
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from carid.indexer import CarIndex, SharedCarIndex  # noqa: E402
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+def _mem_mb() -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    out[key] = int(rest.split()[0]) / 1024.0
+    except FileNotFoundError:
+        import resource
+        out["Rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return out
+
+def _digest(results: List[List[Dict[str, Any]]]) -> str:
+    flat = [(m["id"], m["score"]) for row in results for m in row]
+    return hashlib.sha1(json.dumps(flat).encode()).hexdigest()[:12]
+
+def _worker(mode: str, root: str, dim: int, storage: str, Q: np.ndarray, poll_s: float, conn) -> None:
+    before = _mem_mb()
+    if mode == "shared":
+        idx = SharedCarIndex(root, dim, poll_s=poll_s, storage=storage)
+    else:
+        idx = CarIndex(root, dim, storage=storage)
+    res = idx.search(Q, k=5)
+    after = _mem_mb()
+    conn.send({"pid": os.getpid(), "digest": _digest(res),
+               "version": getattr(idx, "version", None), "before": before, "after": after})
+    if conn.recv() == "recheck":
+        time.sleep(poll_s * 2)  # let the poll interval expire
+        res = idx.search(Q, k=5)
+        conn.send({"pid": os.getpid(), "digest": _digest(res), "version": getattr(idx, "version", None)})
+    conn.close()
+
+def _run_mode(mode: str, root: str, args, Q: np.ndarray, extra: np.ndarray) -> Dict[str, Any]:
+    ctx = mp.get_context("spawn")
+    pipes, procs = [], []
+    for _ in range(args.workers):
+        parent, child = ctx.Pipe()
+        p = ctx.Process(target=_worker, args=(mode, root, args.dim, args.storage, Q, args.poll_s, child))
+        p.start()
+        pipes.append(parent)
+        procs.append(p)
+    first = [c.recv() for c in pipes]
+
+    rec: Dict[str, Any] = {
+        "mode": mode,
+        "workers": args.workers,
+        "consistent": len({r["digest"] for r in first}) == 1,
+        "index_pss_mb_total": round(sum(r["after"].get("Pss", 0) - r["before"].get("Pss", 0) for r in first), 1),
+        "pss_mb_total": round(sum(r["after"].get("Pss", 0) for r in first), 1),
+        "rss_mb_total": round(sum(r["after"].get("Rss", 0) for r in first), 1),
+        "private_mb_total": round(sum(r["after"].get("Private_Clean", 0) + r["after"].get("Private_Dirty", 0) for r in first), 1),
+    }
+
+    if mode == "shared":
+        writer = SharedCarIndex(root, args.dim, storage=args.storage)
+        t = time.perf_counter()
+        writer.add(extra, [{"plate": f"NEW{i:05d}"} for i in range(len(extra))])
+        enroll_s = time.perf_counter() - t
+        expected = _digest(writer.search(Q, k=5))
+        for c in pipes:
+            c.send("recheck")
+        second = [c.recv() for c in pipes]
+        rec["after_enroll"] = {
+            "versions": sorted({r["version"] for r in second}),
+            "writer_version": writer.version,
+            "consistent_with_writer": all(r["digest"] == expected for r in second),
+            "enroll_s": round(enroll_s, 3),
+        }
+    else:
+        for c in pipes:
+            c.send("done")
+    for p in procs:
+        p.join()
+    return rec
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--gallery", type=int, default=50000)
+    ap.add_argument("--queries", type=int, default=64)
+    ap.add_argument("--enroll", type=int, default=16)
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--storage", default="flat", help="CarIndex storage (flat, sq16, sq8, pq, opq)")
+    ap.add_argument("--poll-s", type=float, default=0.2)
+    ap.add_argument("--out", default="")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    G = _unit(rng.standard_normal((args.gallery, args.dim)))
+    Q = _unit(rng.standard_normal((args.queries, args.dim)))
+    extra = _unit(Q[: args.enroll] + 0.01 * rng.standard_normal((args.enroll, args.dim)))
+    metas = [{"plate": f"P{i:06d}"} for i in range(len(G))]
+
+    report: Dict[str, Any] = {"gallery": args.gallery, "dim": args.dim, "storage": args.storage, "results": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        # compact() trains a compressed storage in the foreground, so workers start on the trained index
+        local_root = os.path.join(tmp, "local")
+        local = CarIndex(local_root, args.dim, storage=args.storage, train_async=False)
+        local.add(G, metas)
+        local.compact()
+        shared_root = os.path.join(tmp, "shared")
+        shared = SharedCarIndex(shared_root, args.dim, storage=args.storage, train_async=False)
+        shared.add(G, metas)
+        shared.compact()
+        del local, shared  # the parent must not map either gallery while workers are measured
+
+        for mode, root in (("local", local_root), ("shared", shared_root)):
+            r = _run_mode(mode, root, args, Q, extra)
+            report["results"].append(r)
+            print(f"[bench] {mode}: {r}", file=sys.stderr)
+
+    by_mode = {r["mode"]: r for r in report["results"]}
+    failures: List[str] = []
+    for r in report["results"]:
+        if not r["consistent"]:
+            failures.append(f"{r['mode']}: workers returned different results")
+    after = by_mode["shared"]["after_enroll"]
+    if not after["consistent_with_writer"] or after["versions"] != [after["writer_version"]]:
+        failures.append(f"shared: workers did not converge on v{after['writer_version']} ({after})")
+    shared_pss, local_pss = by_mode["shared"]["pss_mb_total"], by_mode["local"]["pss_mb_total"]
+    if shared_pss > local_pss * 1.05:
+        failures.append(f"shared PSS {shared_pss} MB is above local {local_pss} MB")
+    report["failures"] = failures
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    if failures:
+        raise SystemExit("[bench] FAILED: " + "; ".join(failures))
+
+if __name__ == "__main__":
+    main()
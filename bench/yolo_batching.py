@@ -0,0 +1,121 @@
+"""
+Throughput of the shared YOLO registry under concurrent load: per-call
+(YOLO_BATCH=1, serialized) vs micro-batched predict.
+
+T threads each send R single-image predict() calls (like T concurrent API
+requests in one worker); reports images/s, per-call latency p50/p95 and the
+mean batch size that actually reached model.predict.
+
+    python bench/yolo_batching.py --weights yolov8n.pt --threads 1,4,8,16
+    python bench/yolo_batching.py --images path/to/lot_photos --batch 8 --wait-ms 5
+"""
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import pathlib
+import threading
+from typing import List, Dict, Any
+
+import numpy as np
+import cv2
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from carid import yolo_registry  # noqa: E402
+
+def _images(images: str, n: int) -> List[np.ndarray]:
+    if images:
+        paths = sorted(
+            p for ext in ("*.jpg", "*.jpeg", "*.png")
+            for p in glob.glob(os.path.join(images, "**", ext), recursive=True)
+        )[:n]
+        out = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+        if out:
+            return out
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, size=(720, 1280, 3), dtype=np.uint8) for _ in range(n)]
+
+def _load(weights: str, threads: int, per_thread: int, imgs: List[np.ndarray]) -> Dict[str, Any]:
+    lat: List[float] = []
+    lat_lock = threading.Lock()
+    start = threading.Barrier(threads + 1)
+
+    def client(tid: int):
+        start.wait()
+        mine = []
+        for i in range(per_thread):
+            img = imgs[(tid * per_thread + i) % len(imgs)]
+            t = time.perf_counter()
+            yolo_registry.predict(weights, img, conf=0.25, verbose=False)
+            mine.append((time.perf_counter() - t) * 1000.0)
+        with lat_lock:
+            lat.extend(mine)
+
+    ts = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for t in ts:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in ts:
+        t.join()
+    wall = time.perf_counter() - t0
+    return {
+        "threads": threads,
+        "images_per_s": round(len(lat) / wall, 2),
+        "latency_ms_p50": round(float(np.percentile(lat, 50)), 1),
+        "latency_ms_p95": round(float(np.percentile(lat, 95)), 1),
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--weights", default="yolov8n.pt")
+    ap.add_argument("--images", default="")
+    ap.add_argument("--threads", default="1,4,8,16")
+    ap.add_argument("--requests", type=int, default=16, help="predict calls per thread")
+    ap.add_argument("--batch", type=int, default=8)
+    ap.add_argument("--wait-ms", type=float, default=5.0)
+    ap.add_argument("--out", default="")
+    args = ap.parse_args()
+
+    model = yolo_registry.get_model(args.weights, tag="bench")
+    if model is None:
+        raise SystemExit(f"cannot load {args.weights}")
+
+    # count forward passes / images that reach the model
+    calls = {"predict": 0, "images": 0}
+    inner = model.predict
+
+    def counting_predict(source=None, **kw):
+        calls["predict"] += 1
+        calls["images"] += len(source) if isinstance(source, list) else 1
+        return inner(source=source, **kw)
+
+    model.predict = counting_predict
+
+    imgs = _images(args.images, 32)
+    yolo_registry.predict(args.weights, imgs[0], conf=0.25, verbose=False)  # warm-up
+
+    report: Dict[str, Any] = {"weights": args.weights, "batch": args.batch, "wait_ms": args.wait_ms, "results": []}
+    for mode, (b, w) in (("per_call", (1, 0.0)), ("batched", (args.batch, args.wait_ms))):
+        yolo_registry.configure(b, w)
+        for threads in [int(t) for t in args.threads.split(",") if t.strip()]:
+            calls["predict"] = calls["images"] = 0
+            r = _load(args.weights, threads, args.requests, imgs)
+            r["mode"] = mode
+            r["mean_batch"] = round(calls["images"] / max(1, calls["predict"]), 2)
+            report["results"].append(r)
+            print(f"[bench] {r}", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
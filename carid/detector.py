@@ -1,54 +1,63 @@
 import cv2
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
-# YOLO loaded lazily
-_YOLO = None
+from . import yolo_registry
+
+# COCO weights, loaded lazily through the shared registry
+# (downloads once; if it fails, we fall back to a full-image box)
+WEIGHTS = "yolov8n.pt"
 
 # COCO labels we consider "vehicles"
 VEHICLE_IDS = {2, 3, 5, 7}  # car=2, motorcycle=3, bus=5, truck=7
 
 def _load():
-    global _YOLO
-    if _YOLO is not None:
-        return _YOLO
-    try:
-        from ultralytics import YOLO
-        _YOLO = YOLO("yolov8n.pt")  # downloads once; if it fails, we'll fallback
-        print("[reid] YOLO COCO loaded")
-    except Exception as e:
-        print(f"[reid] YOLO COCO load failed: {e}")
-        _YOLO = None
-    return _YOLO
-
-def detect_vehicles(bgr) -> List[Tuple[int,int,int,int,float,str]]:
+    return yolo_registry.get_model(WEIGHTS, tag="reid")
+
+def detect_vehicles(bgr, regions: Optional[List[Tuple]] = None) -> List[Tuple[int,int,int,int,float,str]]:
     """
     Returns a list of (x, y, w, h, score, label).
-    If nothing found or YOLO unavailable, returns one full-image box.
+    `regions` is an optional list of (crop, x0, y0, mask) regions of interest
+    (e.g. a fixed camera's lot area); only those crops are searched, boxes
+    whose centre falls outside `mask` are dropped, and the rest are mapped
+    back to full-frame coordinates.
+    If nothing found or YOLO unavailable, returns one full-image box
+    (the bounding box of all regions, if given).
     """
     H, W = bgr.shape[:2]
     model = _load()
     boxes: List[Tuple[int,int,int,int,float,str]] = []
 
     if model is not None:
-        results = model.predict(source=bgr, conf=0.25, verbose=False)
-        for r in results:
-            names = r.names
-            if r.boxes is None:
-                continue
-            for b in r.boxes:
-                cls = int(b.cls[0].item()) if hasattr(b.cls[0], "item") else int(b.cls[0])
-                if cls not in VEHICLE_IDS:
+        for (img, x0, y0, mask) in (regions or [(bgr, 0, 0, None)]):
+            h_img, w_img = img.shape[:2]
+            results = yolo_registry.predict(WEIGHTS, img, conf=0.25, verbose=False)
+            for r in results:
+                names = r.names
+                if r.boxes is None:
                     continue
-                x1, y1, x2, y2 = b.xyxy[0].tolist()
-                x1i, y1i = max(0, int(x1)), max(0, int(y1))
-                x2i, y2i = min(W, int(x2)), min(H, int(y2))
-                w, h = max(1, x2i - x1i), max(1, y2i - y1i)
-                conf = float(b.conf[0].item()) if hasattr(b.conf[0], "item") else float(b.conf[0])
-                label = names.get(cls, str(cls))
-                boxes.append((x1i, y1i, w, h, conf, label))
+                for b in r.boxes:
+                    cls = int(b.cls[0].item()) if hasattr(b.cls[0], "item") else int(b.cls[0])
+                    if cls not in VEHICLE_IDS:
+                        continue
+                    x1, y1, x2, y2 = b.xyxy[0].tolist()
+                    x1i, y1i = max(0, int(x1)), max(0, int(y1))
+                    x2i, y2i = min(w_img, int(x2)), min(h_img, int(y2))
+                    w, h = max(1, x2i - x1i), max(1, y2i - y1i)
+                    if mask is not None and not mask[min(y1i + h // 2, h_img - 1), min(x1i + w // 2, w_img - 1)]:
+                        continue
+                    conf = float(b.conf[0].item()) if hasattr(b.conf[0], "item") else float(b.conf[0])
+                    label = names.get(cls, str(cls))
+                    boxes.append((x0 + x1i, y0 + y1i, w, h, conf, label))
 
     if not boxes:
-        boxes = [(0, 0, W, H, 0.01, "full")]
+        if regions:
+            xs0 = min(r[1] for r in regions)
+            ys0 = min(r[2] for r in regions)
+            xs1 = max(r[1] + r[0].shape[1] for r in regions)
+            ys1 = max(r[2] + r[0].shape[0] for r in regions)
+            boxes = [(xs0, ys0, xs1 - xs0, ys1 - ys0, 0.01, "full")]
+        else:
+            boxes = [(0, 0, W, H, 0.01, "full")]
 
     boxes.sort(key=lambda t: t[2] * t[3], reverse=True)  # biggest first
     return boxes[:20]
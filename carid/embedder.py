@@ -1,41 +1,176 @@
+import os
+import time
+from typing import List, Dict
+
 import numpy as np
-import torch
-import open_clip
 import cv2
 from PIL import Image
 
-# CPU-only
-_DEVICE = torch.device("cpu")
+# Inference backend (CPU-only):
+#   torch      -> OpenCLIP fp32 PyTorch (default)
+#   onnx       -> visual tower exported to ONNX, run with ONNX Runtime (fp32)
+#   onnx-int8  -> same, with int8 dynamic quantization of the weights
+# torch/open_clip are only needed by the torch backend and for the one-time export;
+# once the .onnx files exist, the onnx backends run on onnxruntime alone.
+BACKEND = os.getenv("EMBED_BACKEND", "torch").strip().lower()
+BACKENDS = ("torch", "onnx", "onnx-int8")
+if BACKEND not in BACKENDS:
+    raise ValueError(f"EMBED_BACKEND must be one of {BACKENDS}, got '{BACKEND}'")
+
+MODEL_NAME = "ViT-B-32"
+PRETRAINED = "openai"
+
+# where exported .onnx files are cached
+ONNX_DIR = os.getenv(
+    "EMBED_ONNX_DIR", os.path.join(os.path.dirname(__file__), "models")
+)
+ONNX_THREADS = int(os.getenv("EMBED_THREADS", "0"))  # 0 = onnxruntime default
+
+# CLIP preprocessing constants (same as open_clip's eval transform for ViT-B-32)
+_IMAGE_SIZE = 224
+_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
+_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)
 
 # Lazy singletons
+_DEVICE = None
 _MODEL = None
 _PREPROC = None
+_SESSION = None
 
+# ------------------------------ torch backend ------------------------------
 def _load_model():
-    global _MODEL, _PREPROC
+    global _MODEL, _PREPROC, _DEVICE
     if _MODEL is None:
+        import torch
+        import open_clip
+        _DEVICE = torch.device("cpu")
         _MODEL, _, _PREPROC = open_clip.create_model_and_transforms(
-            "ViT-B-32", pretrained="openai", device=_DEVICE
+            MODEL_NAME, pretrained=PRETRAINED, device=_DEVICE
         )
         _MODEL.eval()
     return _MODEL, _PREPROC
 
-def embed_bgr_image(bgr: np.ndarray) -> np.ndarray:
-    """
-    Returns a 512-D float32 L2-normalized vector for a BGR crop.
-    """
+def _embed_torch(bgrs: List[np.ndarray]) -> np.ndarray:
+    import torch
     model, preproc = _load_model()
-    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
-    pil = Image.fromarray(rgb)
-
+    batch = [preproc(Image.fromarray(cv2.cvtColor(b, cv2.COLOR_BGR2RGB))) for b in bgrs]
     with torch.no_grad():
-        img_t = preproc(pil).unsqueeze(0).to(_DEVICE)
+        img_t = torch.stack(batch).to(_DEVICE)
         feats = model.encode_image(img_t)
         feats = feats / feats.norm(dim=-1, keepdim=True)
-    v = feats.cpu().numpy().astype("float32")[0]
-    return v  # shape (512,)
+    return feats.cpu().numpy().astype("float32")
+
+# ------------------------------ onnx backend -------------------------------
+def onnx_paths() -> Dict[str, str]:
+    stem = f"{MODEL_NAME.lower()}-{PRETRAINED}-visual"
+    return {
+        "onnx": os.path.join(ONNX_DIR, f"{stem}.onnx"),
+        "onnx-int8": os.path.join(ONNX_DIR, f"{stem}.int8.onnx"),
+    }
+
+def export_onnx(force: bool = False) -> Dict[str, str]:
+    """
+    Export the OpenCLIP visual tower (with L2-normalization folded in) to ONNX,
+    then write an int8 dynamically-quantized copy next to it.
+    Needs torch + open_clip + onnx + onnxruntime. Returns {backend: path}.
+    """
+    import torch
+    paths = onnx_paths()
+    os.makedirs(ONNX_DIR, exist_ok=True)
+
+    if force or not os.path.isfile(paths["onnx"]):
+        model, _ = _load_model()
+
+        class _Visual(torch.nn.Module):
+            def __init__(self, m):
+                super().__init__()
+                self.m = m
+
+            def forward(self, x):
+                f = self.m.encode_image(x)
+                return f / f.norm(dim=-1, keepdim=True)
+
+        dummy = torch.zeros(1, 3, _IMAGE_SIZE, _IMAGE_SIZE, dtype=torch.float32)
+        t0 = time.time()
+        torch.onnx.export(
+            _Visual(model).eval(), dummy, paths["onnx"],
+            input_names=["pixel_values"], output_names=["embedding"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "embedding": {0: "batch"}},
+            opset_version=17,
+        )
+        print(f"[reid] exported ONNX visual tower in {time.time() - t0:.1f}s: {paths['onnx']}")
+
+    if force or not os.path.isfile(paths["onnx-int8"]):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(paths["onnx"], paths["onnx-int8"], weight_type=QuantType.QInt8)
+        print(f"[reid] wrote int8 ONNX model: {paths['onnx-int8']}")
+
+    return paths
+
+def _load_session():
+    global _SESSION
+    if _SESSION is None:
+        import onnxruntime as ort
+        path = onnx_paths()[BACKEND]
+        if not os.path.isfile(path):
+            export_onnx()
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS > 0:
+            so.intra_op_num_threads = ONNX_THREADS
+        _SESSION = ort.InferenceSession(path, sess_options=so, providers=["CPUExecutionProvider"])
+        print(f"[reid] ONNX Runtime session loaded ({BACKEND}): {path}")
+    return _SESSION
+
+def _preprocess_np(bgr: np.ndarray) -> np.ndarray:
+    """
+    NumPy port of the CLIP eval transform: bicubic resize of the short side
+    to 224, center crop, scale to [0,1], normalize. Returns (3,224,224) float32.
+    """
+    pil = Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+    w, h = pil.size
+    # same size rule as torchvision.Resize(224): short side -> 224, long side truncated
+    if w <= h:
+        nw, nh = _IMAGE_SIZE, int(_IMAGE_SIZE * h / w)
+    else:
+        nw, nh = int(_IMAGE_SIZE * w / h), _IMAGE_SIZE
+    pil = pil.resize((nw, nh), Image.BICUBIC)
+    left = int(round((nw - _IMAGE_SIZE) / 2.0))
+    top = int(round((nh - _IMAGE_SIZE) / 2.0))
+    pil = pil.crop((left, top, left + _IMAGE_SIZE, top + _IMAGE_SIZE))
+    arr = np.asarray(pil, dtype=np.float32) / 255.0
+    arr = (arr - _MEAN) / _STD
+    return arr.transpose(2, 0, 1)
+
+def _embed_onnx(bgrs: List[np.ndarray]) -> np.ndarray:
+    sess = _load_session()
+    x = np.stack([_preprocess_np(b) for b in bgrs]).astype(np.float32)
+    feats = sess.run(None, {sess.get_inputs()[0].name: x})[0]
+    # the int8 graph's output norm drifts slightly; re-normalize for exact cosine
+    feats = feats / np.linalg.norm(feats, axis=1, keepdims=True)
+    return feats.astype("float32")
+
+# ------------------------------ public API --------------------------------
+def embed_bgr_images(bgrs: List[np.ndarray]) -> np.ndarray:
+    """
+    Returns an (N,512) float32 matrix of L2-normalized vectors for BGR crops,
+    embedded in one batched forward pass.
+    """
+    if not bgrs:
+        return np.zeros((0, dim()), dtype=np.float32)
+    if BACKEND == "torch":
+        return _embed_torch(bgrs)
+    return _embed_onnx(bgrs)
+
+def embed_bgr_image(bgr: np.ndarray) -> np.ndarray:
+    """
+    Returns a 512-D float32 L2-normalized vector for a BGR crop.
+    """
+    return embed_bgr_images([bgr])[0]  # shape (512,)
 
 def dim() -> int:
-    model, _ = _load_model()
-    # ViT-B/32 returns 512-D features
-    return int(model.visual.output_dim)
+    if BACKEND == "torch":
+        model, _ = _load_model()
+        # ViT-B/32 returns 512-D features
+        return int(model.visual.output_dim)
+    return int(_load_session().get_outputs()[0].shape[1])
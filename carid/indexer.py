@@ -1,62 +1,923 @@
-import os, json
-from typing import List, Dict, Any
+import os, json, time, shutil, threading, contextlib
+from typing import List, Dict, Any, Optional
 import numpy as np
 import faiss
 
+# storage -> FAISS factory string (all inner product over L2-normalized vectors = cosine)
+#   flat : exact float32, 4*dim bytes/vector
+#   sq16 : scalar quantized fp16, 2*dim bytes/vector
+#   sq8  : scalar quantized int8, dim bytes/vector (trained)
+#   pq   : product quantization, pq_m bytes/vector (trained)
+#   opq  : pq with a learned OPQ rotation in front (trained)
+STORAGES = ("flat", "sq16", "sq8", "pq", "opq")
+_NEEDS_TRAINING = ("sq8", "pq", "opq")
+# PQ's 256-centroid codebooks want ~39 points per centroid (FAISS warns below 9984)
+_PQ_TRAIN_MIN = 10000
+# training sample cap: enough for 256-centroid codebooks, more only adds training time
+_MAX_TRAIN = 39 * 256
+
+# map index codes in place (shared page cache) where FAISS supports it (>= 1.10);
+# older builds fall back to IO_FLAG_MMAP, which only maps IVF lists
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+# owner/contact fields are stored once per plate (meta["plates"]), not per vector
+PLATE_FIELDS = ("owner_name", "owner_contact", "car_model", "notes")
+# tombstoned rows are dropped from vectors.f32 once they are this share of the file
+_DEAD_COMPACT_FRAC = 0.25
+
+def _farthest_point_sample(X: np.ndarray, m: int) -> List[int]:
+    """Rows of X (unit vectors) for `m` diverse exemplars: the medoid-ish row closest
+    to the mean, then repeatedly the row least similar to everything picked so far."""
+    if len(X) <= m:
+        return list(range(len(X)))
+    picked = [int(np.argmax(X @ X.mean(axis=0)))]
+    nearest = X @ X[picked[0]]  # similarity to the closest picked exemplar
+    while len(picked) < m:
+        i = int(np.argmin(nearest))
+        picked.append(i)
+        nearest = np.maximum(nearest, X @ X[i])
+    return sorted(picked)
+
 class CarIndex:
     """
-    Cosine-similarity index using FAISS (IndexIDMap over IndexFlatIP).
-    Persists to disk (index + meta mapping).
+    Cosine-similarity index using FAISS (IndexIDMap2 over a flat or compressed index).
+    Persists to disk (index + meta mapping + exact float32 vectors).
+
+    Compressed storages keep an exact copy of every vector in `vectors.f32`
+    (memory-mapped, so it lives in the page cache rather than the heap) and
+    re-score the top `k * rerank` compressed candidates against it.
+    Until `train_min` vectors exist, trained storages serve from a flat index;
+    they are retrained once the gallery has grown `retrain_growth` times
+    since the last training, so codebooks keep up with the data. Training
+    never runs inside add(): with `train_async` a background thread runs
+    retrain() and swaps the new index in, otherwise call retrain() yourself.
+
+    `read_only=True` opens the directory as an immutable snapshot: nothing is
+    written, flat storages search the memory-mapped vectors directly and
+    compressed indexes are read with FAISS mmap flags.
+    Flat storage (and trained storages before their first training) has no
+    FAISS index at all: searches run straight over the memory-mapped vectors,
+    so nothing is rebuilt on open and no index.faiss is written.
+    `exclusive=True` holds root_dir/writer.lock for the object's lifetime and
+    raises if another process already has the directory open that way, so a
+    maintenance script cannot overwrite the gallery of a running API.
+
+    Gallery management, per plate: a new vector with cosine >= `dedup` to one
+    already stored for the plate is not stored, and at most `max_per_plate`
+    exemplars are kept (farthest-point sampling; 0 = unbounded). Dropped
+    vectors are tombstoned (removed from meta/index) and purged from
+    vectors.f32 by `compact()`. `centroid_probe > 0` searches per-plate mean
+    vectors first and exact-scores the exemplars of the best
+    `k * centroid_probe` plates only.
     """
-    def __init__(self, root_dir: str, dim: int):
+    def __init__(self, root_dir: str, dim: int, storage: str = "flat",
+                 pq_m: int = 64, train_min: Optional[int] = None, rerank: int = 4,
+                 read_only: bool = False, dedup: Optional[float] = 0.97,
+                 max_per_plate: int = 8, centroid_probe: int = 0, retrain_growth: float = 2.0,
+                 train_async: bool = True, exclusive: bool = False):
+        if storage not in STORAGES:
+            raise ValueError(f"storage must be one of {STORAGES}, got '{storage}'")
+        if storage in ("pq", "opq") and dim % pq_m:
+            raise ValueError(f"pq_m={pq_m} must divide dim={dim}")
         self.root_dir = root_dir
         os.makedirs(self.root_dir, exist_ok=True)
         self.index_path = os.path.join(self.root_dir, "index.faiss")
         self.meta_path  = os.path.join(self.root_dir, "meta.json")
+        self.vec_path   = os.path.join(self.root_dir, "vectors.f32")
+        self.vec_ids_path = os.path.join(self.root_dir, "vectors.ids")
         self.dim = dim
+        self.storage = storage
+        self.pq_m = pq_m
+        # PQ needs >= 256 points to fit its 8-bit codebooks; more gives better codebooks
+        floor = 256 if storage in ("pq", "opq") else 1
+        self.train_min = max(floor, train_min if train_min is not None else (256 if storage == "sq8" else _PQ_TRAIN_MIN))
+        self.retrain_growth = float(retrain_growth)
+        self.train_async = train_async
+        self.rerank = max(1, int(rerank))
+        self.read_only = read_only
+        self.dedup = dedup if dedup else None
+        self.max_per_plate = max(0, int(max_per_plate))
+        self.centroid_probe = max(0, int(centroid_probe))
         self.index = None
-        self.meta: Dict[str, Any] = {"next_id": 1, "items": {}}  # id -> meta dict
+        # items: id -> {plate, image_url, bbox}; plates: plate -> PLATE_FIELDS
+        self.meta: Dict[str, Any] = {"next_id": 1, "items": {}, "plates": {}}
+        self._vecs: Optional[np.ndarray] = None  # (N, dim) exact vectors, memmap
+        self._vec_ids = np.zeros((0,), dtype=np.int64)
+        self._row: Dict[int, int] = {}  # live id -> row in vectors.f32
+        self._live = np.zeros((0,), dtype=bool)  # per row: False = tombstoned
+        self._plate_ids: Dict[str, List[int]] = {}  # plate -> live ids
+        self._centroids: Optional[tuple] = None  # (plates, (P, dim) unit means), built lazily
+        self._lock = threading.RLock()  # add/search may run on different threadpool threads
+        self._train_lock = threading.Lock()  # one retrain() at a time
+        self._train_thread: Optional[threading.Thread] = None
+        self._owner_lock = None
+        if exclusive:
+            self._owner_lock = _try_lock(os.path.join(self.root_dir, "writer.lock"))
+            if self._owner_lock is None:
+                raise RuntimeError(f"CarIndex at {self.root_dir} is open in another process")
         self._load()
 
+    # ---------- persistence ----------
     def _load(self):
-        if os.path.exists(self.index_path):
-            self.index = faiss.read_index(self.index_path)
-        else:
-            base = faiss.IndexFlatIP(self.dim)  # inner product over L2-normalized vectors = cosine
-            self.index = faiss.IndexIDMap2(base)
+        if self.read_only and not os.path.exists(self.meta_path):
+            raise FileNotFoundError(f"no snapshot at {self.root_dir}")
         if os.path.exists(self.meta_path):
             with open(self.meta_path, "r", encoding="utf-8") as f:
                 self.meta = json.load(f)
+            self.meta.setdefault("plates", {})
+        if self.read_only:
+            self.storage = self.meta.get("storage", self.storage)
+            self._load_vectors()
+            if self.meta.get("index_kind", "flat") != "flat":
+                self.index = faiss.read_index(self.index_path, _MMAP_FLAGS)
+            return
+        legacy = os.path.exists(self.index_path) and not os.path.exists(self.vec_ids_path)
+        if os.path.exists(self.index_path) and (legacy or self.meta.get("index_kind", "flat") != "flat"):
+            self.index = faiss.read_index(self.index_path)
+        if legacy and self.index.ntotal > 0:
+            self._export_flat_vectors()
+        self._load_vectors()
+        self._drop_torn_tail()
+        kind_before = self.meta.get("index_kind")
+        if self.index is None or kind_before != self.storage:
+            self._rebuild()
+            # a flat index rebuilt in RAM changes nothing on disk; other processes
+            # may be reading meta.json right now
+            stale_flat = self.meta["index_kind"] == "flat" and os.path.exists(self.index_path)
+            if legacy or stale_flat or self.meta["index_kind"] != kind_before:
+                self._save()
+        self._schedule_training()
 
     def _save(self):
-        faiss.write_index(self.index, self.index_path)
-        with open(self.meta_path, "w", encoding="utf-8") as f:
-            json.dump(self.meta, f, indent=2)
+        if self.meta.get("index_kind", "flat") != "flat":
+            tmp = f"{self.index_path}.{os.getpid()}.tmp"
+            faiss.write_index(self.index, tmp)
+            os.replace(tmp, self.index_path)
+        elif os.path.exists(self.index_path):
+            os.remove(self.index_path)  # stale copy from before the flat index stopped being written
+        tmp = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.meta))  # one-shot dumps uses the C encoder; indent/dump() don't
+        os.replace(tmp, self.meta_path)  # readers never see a half-written file
+
+    def _load_vectors(self):
+        self._vecs = None  # release the old mapping before re-mapping a grown file
+        ids = np.fromfile(self.vec_ids_path, dtype=np.int64) if os.path.exists(self.vec_ids_path) else np.zeros((0,), dtype=np.int64)
+        n_vec = os.path.getsize(self.vec_path) // (4 * self.dim) if os.path.exists(self.vec_path) else 0
+        n = min(len(ids), n_vec)  # tolerate a torn append
+        self._vec_ids = ids[:n]
+        items = self.meta["items"]
+        item_ids = np.fromiter(map(int, items), dtype=np.int64, count=len(items))
+        self._live = np.isin(self._vec_ids, item_ids)
+        rows = np.flatnonzero(self._live)
+        self._row = dict(zip(self._vec_ids[rows].tolist(), rows.tolist()))
+        self._plate_ids = {}
+        for key, item in items.items():
+            id_ = int(key)
+            if id_ in self._row:
+                plate = (item.get("plate") or "").upper() or f"#{id_}"
+                self._plate_ids.setdefault(plate, []).append(id_)
+        self._centroids = None
+        self._map_vectors()
+
+    def _map_vectors(self):
+        n = len(self._vec_ids)
+        if n:
+            self._vecs = np.memmap(self.vec_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+        else:
+            self._vecs = np.zeros((0, self.dim), dtype=np.float32)
+
+    def _drop_torn_tail(self):
+        """
+        Cut rows past the last complete (vector, id) pair and skip the ids of
+        rows an interrupted add() appended without saving meta, so they are
+        never handed out twice. Readers only ever map complete rows.
+        """
+        n = len(self._vec_ids)
+        for path, size in ((self.vec_path, n * 4 * self.dim), (self.vec_ids_path, n * 8)):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+        if n:
+            self.meta["next_id"] = max(int(self.meta.get("next_id", 1)), int(self._vec_ids.max()) + 1)
+
+    def _append_vectors(self, vecs: np.ndarray, ids: List[int]):
+        self._vecs = None  # Windows refuses to extend a file with a live mapping
+        with open(self.vec_path, "ab") as f:
+            f.write(np.ascontiguousarray(vecs, dtype=np.float32).tobytes())
+        with open(self.vec_ids_path, "ab") as f:
+            f.write(np.asarray(ids, dtype=np.int64).tobytes())
+        # extend the row bookkeeping instead of re-reading vectors.ids
+        n0 = len(self._vec_ids)
+        self._vec_ids = np.concatenate([self._vec_ids, np.asarray(ids, dtype=np.int64)])
+        live = np.asarray([str(i) in self.meta["items"] for i in ids], dtype=bool)
+        self._live = np.concatenate([self._live, live])
+        for r, id_ in enumerate(ids):
+            if live[r]:
+                self._row[int(id_)] = n0 + r
+                self._plate_ids.setdefault(self._plate_of(id_), []).append(int(id_))
+        self._centroids = None
+        self._map_vectors()
+
+    def _rewrite_vectors(self):
+        """Drop tombstoned rows from vectors.f32 / vectors.ids (atomic replace)."""
+        keep = np.flatnonzero(self._live)
+        X = np.ascontiguousarray(self._vecs[keep], dtype=np.float32)
+        ids = self._vec_ids[keep]
+        self._vecs = None
+        for path, data in ((self.vec_path, X), (self.vec_ids_path, ids)):
+            with open(path + ".tmp", "wb") as f:
+                f.write(data.tobytes())
+            os.replace(path + ".tmp", path)
+        self._load_vectors()
+
+    def _export_flat_vectors(self):
+        # galleries written before vectors.f32 existed: recover vectors from the flat index
+        try:
+            sub = faiss.downcast_index(self.index.index)
+            X = sub.reconstruct_n(0, self.index.ntotal)
+            ids = faiss.vector_to_array(self.index.id_map).astype(np.int64)
+        except Exception as e:
+            raise RuntimeError(f"cannot recover exact vectors from {self.index_path}: {e}")
+        self._append_vectors(X, ids.tolist())
+
+    # ---------- index construction ----------
+    def _training_due(self) -> bool:
+        if self.storage not in _NEEDS_TRAINING or len(self._row) < self.train_min:
+            return False
+        if self.meta.get("index_kind", "flat") != self.storage:
+            return True  # still serving from the flat fallback
+        if self.retrain_growth <= 1.0:
+            return False
+        return len(self._row) >= self.retrain_growth * max(1, self.meta.get("trained_on", 0))
+
+    def _factory(self, kind: str) -> str:
+        return {
+            "sq16": "IDMap2,SQfp16",
+            "sq8": "IDMap2,SQ8",
+            # "np": no polysemous training, which only serves Hamming-distance
+            # search and costs minutes per train
+            "pq": f"IDMap2,PQ{self.pq_m}np",
+            "opq": f"IDMap2,OPQ{self.pq_m},PQ{self.pq_m}np",
+        }[kind]
+
+    def _trained_index(self, X: np.ndarray):
+        """Empty index of the configured storage, trained on (a sample of) X."""
+        index = faiss.index_factory(self.dim, self._factory(self.storage), faiss.METRIC_INNER_PRODUCT)
+        if len(X) > _MAX_TRAIN:
+            X = X[np.sort(np.random.default_rng(0).choice(len(X), _MAX_TRAIN, replace=False))]
+        index.train(X)
+        return index
+
+    def _rebuild(self, retrain: bool = False):
+        """
+        Re-add every live vector to a fresh index. Trained storages keep the
+        current codebooks (or serve flat until first trained) unless `retrain`.
+        """
+        live = np.flatnonzero(self._live)
+        kind, index = self.storage, None
+        if self.storage not in _NEEDS_TRAINING:
+            pass
+        elif retrain and len(live) >= self.train_min:
+            index = self._trained_index(np.ascontiguousarray(self._vecs[live], dtype=np.float32))
+            self.meta["trained_on"] = len(live)
+        elif self.index is not None and self.meta.get("index_kind") == self.storage:
+            index = faiss.clone_index(self.index)
+            index.reset()
+        else:
+            kind = "flat"
+        self.meta["index_kind"] = kind
+        self.meta["storage"] = self.storage
+        if kind == "flat":
+            self.index = None  # searched straight over the mapped vectors
+            return
+        if index is None:
+            index = faiss.index_factory(self.dim, self._factory(kind), faiss.METRIC_INNER_PRODUCT)
+        if len(live):
+            index.add_with_ids(np.ascontiguousarray(self._vecs[live], dtype=np.float32), self._vec_ids[live])
+        self.index = index
+
+    def _schedule_training(self):
+        if not self.train_async or self.read_only or not self._training_due():
+            return
+        if self._train_thread is not None and self._train_thread.is_alive():
+            return
+        self._train_thread = threading.Thread(target=self._train_in_background, name="carindex-train", daemon=True)
+        self._train_thread.start()
+
+    def _train_in_background(self):
+        try:
+            if self.retrain():
+                print(f"[reid] trained {self.storage} index on {self.meta.get('trained_on')} vectors")
+        except Exception as e:
+            print(f"[reid] {self.storage} index training failed, keeping the current index: {type(e).__name__}: {e}")
+
+    def retrain(self) -> bool:
+        """
+        Train the configured compressed storage on the current vectors, if
+        due, and swap the new index in. Training and encoding run outside the
+        index lock, so adds and searches carry on against the old index; the
+        vectors added or dropped meanwhile are applied before the swap.
+        Returns False when no training was due (or another one is running).
+        """
+        if self.read_only:
+            raise RuntimeError(f"CarIndex at {self.root_dir} is read-only")
+        if not self._train_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                if not self._training_due():
+                    return False
+            index, ids = self._train_on_live()
+            with self._lock:
+                self._install(index, ids)
+            return True
+        finally:
+            self._train_lock.release()
+
+    def _train_on_live(self):
+        """(index, ids): a newly trained index holding the current live vectors. Slow; runs unlocked."""
+        with self._lock:
+            live = np.flatnonzero(self._live)
+            ids = self._vec_ids[live]
+            X = np.ascontiguousarray(self._vecs[live], dtype=np.float32)  # a copy, not the mapping
+        index = self._trained_index(X)
+        index.add_with_ids(X, ids)
+        return index, ids
+
+    def _install(self, index, ids: np.ndarray):
+        """Swap in an index trained over `ids`, catching up on vectors added/dropped since. Caller holds the lock."""
+        now = self._vec_ids[self._live]
+        gone = np.setdiff1d(ids, now)
+        if len(gone):
+            index.remove_ids(gone)
+        new = np.setdiff1d(now, ids)
+        if len(new):
+            rows = np.asarray([self._row[int(i)] for i in new], dtype=np.int64)
+            index.add_with_ids(np.ascontiguousarray(self._vecs[rows], dtype=np.float32), new)
+        self.index = index
+        self.meta["index_kind"] = self.storage
+        self.meta["storage"] = self.storage
+        self.meta["trained_on"] = len(ids)
+        self._save()
+
+    # ---------- gallery management ----------
+    def _plate_of(self, id_: int) -> str:
+        plate = (self.meta["items"].get(str(id_), {}).get("plate") or "").upper()
+        return plate or f"#{id_}"  # vectors without a plate are their own group
+
+    def _plate_vecs(self, plate: str) -> np.ndarray:
+        rows = [self._row[i] for i in self._plate_ids.get(plate, [])]
+        return np.asarray(self._vecs[rows], dtype=np.float32) if rows else np.zeros((0, self.dim), dtype=np.float32)
+
+    def _set_plate_record(self, plate: str, m: Dict[str, Any]):
+        rec = self.meta["plates"].setdefault(plate, {})
+        for key in PLATE_FIELDS:
+            if m.get(key):
+                rec[key] = m[key]
+
+    def _select_exemplars(self, plate: str) -> List[int]:
+        """Live ids of `plate` to drop so that at most max_per_plate diverse ones remain."""
+        ids = self._plate_ids.get(plate, [])
+        if not self.max_per_plate or len(ids) <= self.max_per_plate:
+            return []
+        keep = set(_farthest_point_sample(self._plate_vecs(plate), self.max_per_plate))
+        return [id_ for j, id_ in enumerate(ids) if j not in keep]
 
-    def add(self, vecs: np.ndarray, metas: List[Dict[str, Any]]) -> List[int]:
+    def _duplicate_of(self, plate: str, vec: np.ndarray, seen: List[tuple]) -> Optional[int]:
+        """Id of a stored (or `seen`, not yet stored) exemplar of `plate` with cosine >= dedup."""
+        cand_ids = self._plate_ids.get(plate, []) + [i for i, _ in seen]
+        if self.dedup is None or not cand_ids:
+            return None
+        C = np.vstack([self._plate_vecs(plate)] + [v[None, :] for _, v in seen])
+        sims = C @ vec
+        best = int(np.argmax(sims))
+        return cand_ids[best] if sims[best] >= self.dedup else None
+
+    def duplicate_ids(self, vecs: np.ndarray, metas: List[Dict[str, Any]]) -> Optional[List[int]]:
+        """
+        If add(vecs, metas) would change nothing (every vector a near-duplicate
+        of a stored exemplar, no new owner/contact values), the ids it would
+        return; otherwise None. Works on read-only snapshots.
+        """
+        with self._lock:
+            ids: List[int] = []
+            for j, m in enumerate(metas):
+                plate = (m.get("plate") or "").upper()
+                rec = self.meta["plates"].get(plate, {})
+                if not plate or any(m.get(k) and rec.get(k) != m[k] for k in PLATE_FIELDS):
+                    return None
+                dup = self._duplicate_of(plate, vecs[j], [])
+                if dup is None:
+                    return None
+                ids.append(dup)
+            return ids
+
+    def _tombstone(self, ids: List[int]):
+        if not ids:
+            return
+        for id_ in ids:
+            plate = self._plate_of(id_)
+            self.meta["items"].pop(str(id_), None)
+            row = self._row.pop(id_, None)
+            if row is not None:
+                self._live[row] = False
+            pids = self._plate_ids.get(plate, [])
+            if id_ in pids:
+                pids.remove(id_)
+                if not pids:
+                    del self._plate_ids[plate]
+        self._centroids = None
+        if self.index is None:
+            return
+        try:
+            self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+        except RuntimeError:
+            self._rebuild()  # storage without remove_ids
+
+    # ---------- public API ----------
+    def add(self, vecs: np.ndarray, metas: List[Dict[str, Any]], with_status: bool = False):
+        """
+        Add vectors with their metadata. Returns one id per input; a vector
+        skipped as a near-duplicate (or dropped by the per-plate cap) returns
+        the id of the stored exemplar closest to it. With `with_status`,
+        returns (ids, stored) where stored[j] says whether input j was kept.
+        """
+        with self._lock:
+            ids, stored = self._add(vecs, metas)
+        return (ids, stored) if with_status else ids
+
+    def _add(self, vecs: np.ndarray, metas: List[Dict[str, Any]]):
         assert vecs.dtype == np.float32 and vecs.ndim == 2 and vecs.shape[1] == self.dim
+        if self.read_only:
+            raise RuntimeError(f"CarIndex at {self.root_dir} is read-only")
         ids: List[int] = []
-        for m in metas:
+        new_ids: List[int] = []
+        new_rows: List[int] = []
+        pending: Dict[str, List[tuple]] = {}  # plate -> [(id, vec)] accepted in this call
+        for j, m in enumerate(metas):
+            item = {k: v for k, v in m.items() if k not in PLATE_FIELDS}
+            plate = (item.get("plate") or "").upper()
+            if plate:
+                item["plate"] = plate
+                self._set_plate_record(plate, m)
+            dup = self._duplicate_of(plate, vecs[j], pending.get(plate, [])) if plate else None
+            if dup is not None:
+                ids.append(dup)
+                continue
             id_ = int(self.meta.get("next_id", 1))
-            self.meta["items"][str(id_)] = m
-            ids.append(id_)
+            self.meta["items"][str(id_)] = item
             self.meta["next_id"] = id_ + 1
-        self.index.add_with_ids(vecs, np.asarray(ids, dtype=np.int64))
+            ids.append(id_)
+            new_ids.append(id_)
+            new_rows.append(j)
+            if plate:
+                pending.setdefault(plate, []).append((id_, vecs[j]))
+
+        if new_ids:
+            X = np.ascontiguousarray(vecs[new_rows], dtype=np.float32)
+            self._append_vectors(X, new_ids)
+            if self.index is not None:
+                self.index.add_with_ids(X, np.asarray(new_ids, dtype=np.int64))
+            # enforce the per-plate cap (may drop older exemplars or the new one)
+            dropped = [d for plate in pending for d in self._select_exemplars(plate)]
+            self._tombstone(dropped)
+            kept = set(new_ids) - set(dropped)
+            stored = [id_ in kept for id_ in ids]
+            for j, id_ in enumerate(ids):
+                if id_ in dropped:  # report the closest exemplar that was kept instead
+                    plate = (metas[j].get("plate") or "").upper()
+                    keep = self._plate_ids[plate]
+                    ids[j] = keep[int(np.argmax(self._plate_vecs(plate) @ vecs[j]))]
+            if len(self._vec_ids) - len(self._row) > _DEAD_COMPACT_FRAC * max(1024, len(self._vec_ids)):
+                self._rewrite_vectors()
+        else:
+            stored = [False] * len(ids)
+        self._save()
+        self._schedule_training()  # enough vectors to (re)train the compressed storage
+        return ids, stored
+
+    def compact(self, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Consolidate an existing gallery: move per-vector owner/contact fields
+        into the per-plate records, drop near-duplicates (`dedup`) and cap each
+        plate to `max_per_plate` diverse exemplars, purge tombstoned rows from
+        vectors.f32 and rebuild the index. `dry_run` only reports the counts
+        (also on read-only snapshots).
+        """
+        with self._lock:
+            return self._compact(dry_run)
+
+    def _compact(self, dry_run: bool) -> Dict[str, int]:
+        stats = {"vectors_before": len(self._row), "plates": len(self._plate_ids),
+                 "duplicates": 0, "over_cap": 0, "rows_purged": len(self._vec_ids) - len(self._row)}
+        drop: List[int] = []
+        for plate, pids in self._plate_ids.items():
+            if plate.startswith("#"):
+                continue
+            X = self._plate_vecs(plate)
+            kept: List[int] = []
+            for j in range(len(pids)):
+                if self.dedup is not None and kept and float(np.max(X[kept] @ X[j])) >= self.dedup:
+                    drop.append(pids[j])
+                    stats["duplicates"] += 1
+                else:
+                    kept.append(j)
+            if self.max_per_plate and len(kept) > self.max_per_plate:
+                sel = set(_farthest_point_sample(X[kept], self.max_per_plate))
+                over = [pids[j] for n, j in enumerate(kept) if n not in sel]
+                drop += over
+                stats["over_cap"] += len(over)
+        stats["vectors_after"] = stats["vectors_before"] - len(drop)
+        stats["rows_purged"] += len(drop)
+        if dry_run:
+            return stats
+        if self.read_only:
+            raise RuntimeError(f"CarIndex at {self.root_dir} is read-only")
+
+        for id_ in sorted(self._row):  # oldest first, so later enrollments win
+            item = self.meta["items"][str(id_)]
+            plate = (item.get("plate") or "").upper()
+            if plate:
+                self._set_plate_record(plate, item)
+            for key in PLATE_FIELDS:
+                item.pop(key, None)
+        for id_ in drop:
+            self.meta["items"].pop(str(id_), None)
+        self._load_vectors()
+        self._rewrite_vectors()
+        self._rebuild(retrain=self._training_due())
         self._save()
-        return ids
+        return stats
+
+    def _rerank(self, qvecs: np.ndarray, I: np.ndarray, k: int):
+        D2 = np.full((I.shape[0], k), -np.inf, dtype=np.float32)
+        I2 = np.full((I.shape[0], k), -1, dtype=np.int64)
+        for i in range(I.shape[0]):
+            cand = np.asarray([c for c in I[i].tolist() if c in self._row], dtype=np.int64)
+            if not len(cand):
+                continue
+            rows = np.asarray([self._row[c] for c in cand.tolist()], dtype=np.int64)
+            scores = self._vecs[rows] @ qvecs[i]
+            top = np.argsort(-scores)[:k]
+            D2[i, :len(top)] = scores[top]
+            I2[i, :len(top)] = cand[top]
+        return D2, I2
+
+    def _flat_search(self, qvecs: np.ndarray, k: int):
+        # exact search straight over the memory-mapped vectors (no private copy)
+        D = np.full((qvecs.shape[0], k), -np.inf, dtype=np.float32)
+        I = np.full((qvecs.shape[0], k), -1, dtype=np.int64)
+        kk = min(k, len(self._vec_ids))
+        if kk == 0:
+            return D, I
+        S = qvecs @ self._vecs.T  # (nq, N)
+        S[:, ~self._live] = -np.inf
+        top = np.argpartition(-S, kk - 1, axis=1)[:, :kk]
+        s_top = np.take_along_axis(S, top, axis=1)
+        order = np.argsort(-s_top, axis=1)
+        D[:, :kk] = np.take_along_axis(s_top, order, axis=1)
+        I[:, :kk] = self._vec_ids[np.take_along_axis(top, order, axis=1)]
+        I[~np.isfinite(D)] = -1  # fewer live vectors than k
+        return D, I
+
+    def _centroid_search(self, qvecs: np.ndarray, k: int, k_fetch: int):
+        # first stage over one unit mean per plate, then exact scores for the
+        # exemplars of the best k * centroid_probe plates
+        if self._centroids is None:
+            plates = list(self._plate_ids)
+            C = np.stack([self._plate_vecs(p).mean(axis=0) for p in plates]) if plates else np.zeros((0, self.dim), dtype=np.float32)
+            C /= np.maximum(np.linalg.norm(C, axis=1, keepdims=True), 1e-12)
+            self._centroids = (plates, C.astype(np.float32))
+        plates, C = self._centroids
+        D = np.full((qvecs.shape[0], k_fetch), -np.inf, dtype=np.float32)
+        I = np.full((qvecs.shape[0], k_fetch), -1, dtype=np.int64)
+        n_probe = min(len(plates), k * self.centroid_probe)
+        if n_probe == 0:
+            return D, I
+        S = qvecs @ C.T
+        probe = np.argpartition(-S, n_probe - 1, axis=1)[:, :n_probe]
+        for i in range(qvecs.shape[0]):
+            cand = np.asarray([id_ for p in probe[i] for id_ in self._plate_ids[plates[p]]], dtype=np.int64)
+            rows = np.asarray([self._row[c] for c in cand.tolist()], dtype=np.int64)
+            scores = self._vecs[rows] @ qvecs[i]
+            top = np.argsort(-scores)[:k_fetch]
+            D[i, :len(top)] = scores[top]
+            I[i, :len(top)] = cand[top]
+        return D, I
 
-    def search(self, qvecs: np.ndarray, k: int = 3) -> List[List[Dict[str, Any]]]:
+    def search(self, qvecs: np.ndarray, k: int = 3, unique_plates: bool = True) -> List[List[Dict[str, Any]]]:
+        """
+        Top-k matches per query as {"id", "score", "meta"}; meta is the
+        vector's item merged with its plate record. With `unique_plates`
+        only the best exemplar of each plate is returned.
+        """
+        with self._lock:
+            return self._search(qvecs, k, unique_plates)
+
+    def _search(self, qvecs: np.ndarray, k: int, unique_plates: bool) -> List[List[Dict[str, Any]]]:
         assert qvecs.dtype == np.float32 and qvecs.ndim == 2 and qvecs.shape[1] == self.dim
-        D, I = self.index.search(qvecs, k)
+        # over-fetch so that k distinct plates survive the collapse
+        k_fetch = k * (self.max_per_plate or 8) if unique_plates else k
+        k_fetch = max(k, min(k_fetch, len(self._row)))
+        compressed = self.meta.get("index_kind", "flat") != "flat"
+        if self.centroid_probe:
+            D, I = self._centroid_search(qvecs, k, k_fetch)
+        elif self.index is None:
+            D, I = self._flat_search(qvecs, k_fetch)
+        elif compressed and self.rerank > 1:
+            _, I = self.index.search(qvecs, k_fetch * self.rerank)
+            D, I = self._rerank(qvecs, I, k_fetch)
+        else:
+            D, I = self.index.search(qvecs, k_fetch)
         out: List[List[Dict[str, Any]]] = []
         for i in range(I.shape[0]):
             row: List[Dict[str, Any]] = []
+            seen = set()
             for j in range(I.shape[1]):
                 idx = int(I[i, j])
                 score = float(D[i, j])
-                if idx == -1:
+                if idx == -1 or idx not in self._row:
+                    continue
+                plate = self._plate_of(idx)
+                if unique_plates and plate in seen:
                     continue
-                meta = self.meta["items"].get(str(idx), {})
+                seen.add(plate)
+                item = self.meta["items"][str(idx)]
+                meta = {**item, **self.meta["plates"].get(plate, {})}
                 row.append({"id": idx, "score": round(score, 4), "meta": meta})
+                if len(row) == k:
+                    break
             out.append(row)
         return out
+
+    def update_items(self, fn) -> int:
+        """
+        Edit per-vector metadata in place: fn(item) is called for every stored
+        item and returns True if it changed it. Saves once if anything changed
+        and returns the number of changed items.
+        """
+        if self.read_only:
+            raise RuntimeError(f"CarIndex at {self.root_dir} is read-only")
+        with self._lock:
+            n = sum(1 for item in self.meta["items"].values() if fn(item))
+            if n:
+                self._save()
+            return n
+
+    def stats(self) -> Dict[str, int]:
+        return {"vectors": len(self._row), "plates": len(self._plate_ids),
+                "rows_on_disk": len(self._vec_ids)}
+
+    def code_size(self) -> int:
+        """Bytes per stored vector in the in-RAM index (excluding the 8-byte id)."""
+        if self.index is None:
+            return 4 * self.dim
+        sub = faiss.downcast_index(self.index.index)
+        if isinstance(sub, faiss.IndexPreTransform):
+            sub = faiss.downcast_index(sub.index)
+        return int(getattr(sub, "code_size", 4 * self.dim))
+
+
+# ---------- single-writer / multi-reader snapshots ----------
+@contextlib.contextmanager
+def _exclusive_lock(path: str):
+    """Cross-process exclusive lock on `path` (flock on POSIX, msvcrt on Windows)."""
+    f = open(path, "a+b")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after ~10s; keep waiting
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+    finally:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+def _try_lock(path: str):
+    """Non-blocking exclusive lock on `path`: the open file (keep it to hold the lock), or None if it is held."""
+    f = open(path, "a+b")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+class SharedCarIndex:
+    """
+    CarIndex shared by several processes (e.g. uvicorn workers) through
+    immutable, versioned snapshots:
+
+        root_dir/CURRENT              -> "7"
+        root_dir/snapshots/v000007/   -> a complete CarIndex directory
+        root_dir/writer.lock
+
+    Enrollments take the writer lock, hard-link the current snapshot into a
+    new directory, add there and publish it as the next version (atomic
+    rename + CURRENT swap), so only one writer ever mutates state. Every process serves searches from
+    a read-only, memory-mapped snapshot (pages shared through the OS) and
+    hot-swaps to a newer version at most every `poll_s` seconds.
+    Compressed storages are trained from the served snapshot in a background
+    thread and published like any other write, so enrollments never wait for
+    a training run.
+    A legacy flat layout (root_dir/index.faiss + meta.json) becomes v1.
+    """
+    def __init__(self, root_dir: str, dim: int, poll_s: float = 1.0, keep: int = 3, **index_kwargs):
+        self.root_dir = root_dir
+        self.snap_root = os.path.join(root_dir, "snapshots")
+        os.makedirs(self.snap_root, exist_ok=True)
+        self.current_path = os.path.join(root_dir, "CURRENT")
+        self.lock_path = os.path.join(root_dir, "writer.lock")
+        self.dim = dim
+        self.poll_s = poll_s
+        self.keep = max(2, keep)
+        self.train_async = index_kwargs.pop("train_async", True)
+        self.index_kwargs = {**index_kwargs, "train_async": False}  # writers are short-lived
+        self._reader: Optional[CarIndex] = None
+        self._version = 0
+        self._checked = 0.0
+        self._swap_lock = threading.Lock()
+        self._train_thread: Optional[threading.Thread] = None
+        with _exclusive_lock(self.lock_path):
+            if self._read_current() == 0:
+                self._publish(self._bootstrap_dir())
+        self._refresh(force=True)
+        self._schedule_training()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    # ---------- snapshot files ----------
+    def _snap_dir(self, version: int) -> str:
+        return os.path.join(self.snap_root, f"v{version:06d}")
+
+    def _read_current(self) -> int:
+        try:
+            with open(self.current_path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _tmp_dir(self) -> str:
+        return os.path.join(self.snap_root, f".tmp-{os.getpid()}-{threading.get_ident()}-{time.time_ns()}")
+
+    def _link_snapshot(self, src: str) -> str:
+        """
+        New tmp dir whose files are hard links to `src`'s. CarIndex replaces
+        meta.json, index.faiss and compacted vectors atomically (which breaks
+        the link) and only appends to vectors.f32/vectors.ids past the rows
+        src's meta.json refers to, so the published snapshot never changes
+        under its readers.
+        """
+        tmp = self._tmp_dir()
+        os.makedirs(tmp)
+        for name in os.listdir(src):
+            try:
+                os.link(os.path.join(src, name), os.path.join(tmp, name))
+            except OSError:  # filesystem without hard links
+                shutil.copy2(os.path.join(src, name), os.path.join(tmp, name))
+        return tmp
+
+    def _bootstrap_dir(self) -> str:
+        tmp = self._tmp_dir()
+        os.makedirs(tmp)
+        for name in ("index.faiss", "meta.json", "vectors.f32", "vectors.ids"):
+            legacy = os.path.join(self.root_dir, name)
+            if os.path.exists(legacy):
+                shutil.copy2(legacy, os.path.join(tmp, name))
+        CarIndex(tmp, self.dim, **self.index_kwargs)  # migrates/initializes in place
+        return tmp
+
+    def _publish(self, tmp: str) -> int:
+        """Turn a fully written tmp dir into the next version. Caller holds the writer lock."""
+        version = self._read_current() + 1
+        os.replace(tmp, self._snap_dir(version))
+        cur_tmp = self.current_path + ".tmp"
+        with open(cur_tmp, "w", encoding="utf-8") as f:
+            f.write(str(version))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(cur_tmp, self.current_path)
+        # readers already holding an old version keep their mappings (POSIX);
+        # on Windows a still-mapped snapshot just survives until the next publish
+        for name in os.listdir(self.snap_root):
+            if name.startswith("v") and int(name[1:]) <= version - self.keep:
+                shutil.rmtree(os.path.join(self.snap_root, name), ignore_errors=True)
+        return version
+
+    def _refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.poll_s:
+            return
+        with self._swap_lock:
+            self._checked = now
+            version = self._read_current()
+            if version == self._version:
+                return
+            try:
+                search_kw = {k: v for k, v in self.index_kwargs.items()
+                             if k in ("storage", "pq_m", "train_min", "retrain_growth",
+                                      "rerank", "dedup", "max_per_plate", "centroid_probe")}
+                reader = CarIndex(self._snap_dir(version), self.dim, read_only=True, **search_kw)
+            except (FileNotFoundError, RuntimeError) as e:
+                # the snapshot was collected between reading CURRENT and opening it
+                print(f"[reid] snapshot v{version} unavailable, keeping v{self._version}: {e}")
+                return
+            self._reader, self._version = reader, version
+            print(f"[reid] serving index snapshot v{version} ({len(reader._row)} vectors)")
+
+    def _write(self, fn, noop=None):
+        """
+        Run fn(writer CarIndex) on a copy of the current snapshot and publish it.
+        If noop(reader) returns a result instead of None, nothing is copied or
+        published and that result is returned.
+        """
+        with _exclusive_lock(self.lock_path):
+            if noop is not None:
+                self._refresh(force=True)  # no other writer can publish while we hold the lock
+                result = noop(self._reader)
+                if result is not None:
+                    return result
+            tmp = self._link_snapshot(self._snap_dir(self._read_current()))
+            writer = CarIndex(tmp, self.dim, **self.index_kwargs)
+            result = fn(writer)
+            del writer  # drop the vectors mapping before the directory is renamed
+            self._publish(tmp)
+        self._refresh(force=True)
+        return result
+
+    def _schedule_training(self):
+        if not self.train_async or not self._reader._training_due():
+            return
+        if self._train_thread is not None and self._train_thread.is_alive():
+            return
+        self._train_thread = threading.Thread(target=self._train_in_background, name="carindex-train", daemon=True)
+        self._train_thread.start()
+
+    def _train_in_background(self):
+        try:
+            reader = self._reader  # immutable snapshot: train without holding any lock
+            index, ids = reader._train_on_live()
+            # another worker may have published a trained version meanwhile
+            trained = self._write(lambda w: w._install(index, ids) or True,
+                                  noop=lambda r: None if r._training_due() else False)
+            if trained:
+                print(f"[reid] trained {reader.storage} index on {len(ids)} vectors, published v{self._version}")
+        except Exception as e:
+            print(f"[reid] index training failed, keeping the current index: {type(e).__name__}: {e}")
+
+    # ---------- public API (same as CarIndex) ----------
+    def add(self, vecs: np.ndarray, metas: List[Dict[str, Any]], with_status: bool = False):
+        def noop(reader):
+            ids = reader.duplicate_ids(vecs, metas)  # near-duplicates only: keep the current version
+            if ids is None:
+                return None
+            return (ids, [False] * len(ids)) if with_status else ids
+        result = self._write(lambda w: w.add(vecs, metas, with_status=with_status), noop=noop)
+        self._schedule_training()
+        return result
+
+    def compact(self, dry_run: bool = False) -> Dict[str, int]:
+        if dry_run:
+            self._refresh(force=True)
+            gallery_kw = {k: v for k, v in self.index_kwargs.items() if k in ("dedup", "max_per_plate")}
+            snap = CarIndex(self._snap_dir(self._version), self.dim, read_only=True, **gallery_kw)
+            return snap.compact(dry_run=True)
+        return self._write(lambda w: w.compact())
+
+    def update_items(self, fn) -> int:
+        def noop(reader):
+            # dry pass on copies: nothing would change -> publish nothing
+            return None if any(fn(dict(item)) for item in reader.meta["items"].values()) else 0
+        return self._write(lambda w: w.update_items(fn), noop=noop)
+
+    def search(self, qvecs: np.ndarray, k: int = 3, unique_plates: bool = True) -> List[List[Dict[str, Any]]]:
+        self._refresh()
+        return self._reader.search(qvecs, k=k, unique_plates=unique_plates)
+
+    def stats(self) -> Dict[str, int]:
+        return self._reader.stats()
+
+    def code_size(self) -> int:
+        return self._reader.code_size()
@@ -0,0 +1,33 @@
+import cv2
+import numpy as np
+from typing import List, Tuple
+
+# Model-free stand-ins for carid.detector / carid.embedder, used when the API
+# runs with PARKTRACK_STUB_MODELS=1 (load tests of the API/DB path only).
+
+_DIM = 512
+
+def detect_vehicles(bgr, regions=None) -> List[Tuple[int,int,int,int,float,str]]:
+    """One full-image box, like detect_vehicles when YOLO finds nothing (regions ignored)."""
+    H, W = bgr.shape[:2]
+    return [(0, 0, W, H, 0.01, "full")]
+
+def embed_bgr_images(bgrs: List[np.ndarray]) -> np.ndarray:
+    """
+    Deterministic 512-D L2-normalized vectors from a 16x32 grayscale thumbnail,
+    so the same image always maps to the same vector (enroll -> identify matches).
+    """
+    if not bgrs:
+        return np.zeros((0, _DIM), dtype=np.float32)
+    vecs = []
+    for b in bgrs:
+        g = cv2.resize(cv2.cvtColor(b, cv2.COLOR_BGR2GRAY), (32, 16), interpolation=cv2.INTER_AREA)
+        v = g.astype(np.float32).reshape(-1) - 127.5
+        vecs.append(v / (np.linalg.norm(v) or 1.0))
+    return np.vstack(vecs).astype(np.float32)
+
+def embed_bgr_image(bgr: np.ndarray) -> np.ndarray:
+    return embed_bgr_images([bgr])[0]
+
+def dim() -> int:
+    return _DIM
@@ -0,0 +1,174 @@
+"""
+Process-wide registry for Ultralytics YOLO models, shared by alpr.pipeline
+(plate detector) and carid.detector (COCO vehicles).
+
+- Each weights file is loaded once per process; loading is lock-protected.
+- A failed load (or missing weights file) is cached and logged once, then
+  retried only after YOLO_RETRY_S seconds instead of on every call.
+- predict() goes through a per-model micro-batcher: calls from different
+  threads that arrive within YOLO_BATCH_WAIT_MS are merged into one batched
+  model.predict and split back per caller. YOLO_BATCH=1 turns batching off
+  (calls are then serialized on a per-model lock).
+- configure() swaps in new batchers; a closed batcher still serves what was
+  queued on it, and later callers holding it predict directly, so no caller
+  is left waiting on a batcher that has stopped.
+"""
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+MAX_BATCH = int(os.getenv("YOLO_BATCH", "8"))
+MAX_WAIT_MS = float(os.getenv("YOLO_BATCH_WAIT_MS", "5"))
+RETRY_S = float(os.getenv("YOLO_RETRY_S", "300"))
+
+_LOCK = threading.Lock()
+_MODELS: Dict[str, Any] = {}             # weights -> YOLO model
+_FAILED: Dict[str, float] = {}           # weights -> monotonic time of the failed load
+_BATCHERS: Dict[str, "_Batcher"] = {}    # weights -> batcher
+
+class _Batcher:
+    """Single background thread that owns model.predict for one model."""
+    def __init__(self, model, max_batch: int, max_wait_ms: float, lock: Optional[threading.Lock] = None):
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._q: "queue.Queue[Optional[Tuple[Any, Tuple, Dict[str, Any], Future]]]" = queue.Queue()
+        # serializes model.predict; a replacement batcher gets the same lock, so the
+        # old thread finishing its last batch never runs concurrently with the new one
+        self._lock = lock or threading.Lock()
+        self._state = threading.Lock()  # closed flag vs. enqueueing
+        self._closed = False
+        if self.max_batch > 1:
+            threading.Thread(target=self._loop, name="yolo-batcher", daemon=True).start()
+
+    def predict(self, img, **kwargs) -> Any:
+        if self.max_batch > 1:
+            fut: Future = Future()
+            with self._state:
+                queued = not self._closed
+                if queued:
+                    self._q.put((img, tuple(sorted(kwargs.items())), kwargs, fut))
+            if queued:
+                return fut.result()
+        # batching off, or this batcher was replaced after the caller looked it up
+        with self._lock:
+            return self.model.predict(source=img, **kwargs)[0]
+
+    def close(self):
+        with self._state:
+            if self._closed:
+                return
+            self._closed = True
+            if self.max_batch > 1:
+                self._q.put(None)  # nothing is enqueued after this
+
+    def _loop(self):
+        while True:
+            first = self._q.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    item = self._q.get(timeout=left)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._q.put(None)  # stop after serving this batch
+                    break
+                batch.append(item)
+            self._serve(batch)
+        # closed: serve anything still queued so no caller waits forever
+        rest = []
+        while True:
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                rest.append(item)
+        for i in range(0, len(rest), self.max_batch):
+            self._serve(rest[i:i + self.max_batch])
+
+    def _serve(self, batch: List) -> None:
+        # only calls with identical predict kwargs can share a forward pass
+        groups: Dict[Tuple, List] = {}
+        for item in batch:
+            groups.setdefault(item[1], []).append(item)
+        for items in groups.values():
+            try:
+                with self._lock:
+                    results = self.model.predict(source=[it[0] for it in items], **items[0][2])
+                for it, r in zip(items, results):
+                    it[3].set_result(r)
+            except Exception as e:
+                for it in items:
+                    it[3].set_exception(e)
+
+def get_model(weights: str, tag: str = "yolo", require_file: bool = False) -> Optional[Any]:
+    """
+    YOLO model for `weights`, or None if it cannot be loaded.
+    require_file=True treats a missing local file as a failure instead of
+    letting Ultralytics try to download it.
+    """
+    key = weights or f"<{tag}:no-weights>"
+    model = _MODELS.get(key)
+    if model is not None:
+        return model
+    failed_at = _FAILED.get(key)
+    if failed_at is not None and time.monotonic() - failed_at < RETRY_S:
+        return None
+
+    with _LOCK:
+        model = _MODELS.get(key)
+        if model is not None:
+            return model
+        failed_at = _FAILED.get(key)
+        if failed_at is not None and time.monotonic() - failed_at < RETRY_S:
+            return None
+        if require_file and (not weights or not os.path.isfile(weights)):
+            print(f"[{tag}] YOLO weights not provided or file not found ({weights or 'unset'}). Using fallback.")
+            _FAILED[key] = time.monotonic()
+            return None
+        try:
+            from ultralytics import YOLO
+            model = YOLO(weights)
+        except Exception as e:
+            print(f"[{tag}] Failed to load YOLO weights '{weights}': {e} (retry in {RETRY_S:.0f}s)")
+            _FAILED[key] = time.monotonic()
+            return None
+        print(f"[{tag}] YOLO loaded: {weights}")
+        _FAILED.pop(key, None)
+        _MODELS[key] = model
+        _BATCHERS[key] = _Batcher(model, MAX_BATCH, MAX_WAIT_MS)
+        return model
+
+def predict(weights: str, img, **kwargs) -> List[Any]:
+    """
+    Same as YOLO(weights).predict(source=img, **kwargs) for one image (a list
+    with one Results), but batched with concurrent callers. Returns [] if the
+    model is unavailable; call get_model() first to pass tag/require_file.
+    """
+    batcher = _BATCHERS.get(weights)
+    if batcher is None:
+        if get_model(weights) is None:
+            return []
+        batcher = _BATCHERS[weights]
+    return [batcher.predict(img, **kwargs)]
+
+def configure(max_batch: int, max_wait_ms: float) -> None:
+    """Replace the batchers of loaded models (new settings apply to later loads too)."""
+    global MAX_BATCH, MAX_WAIT_MS
+    with _LOCK:
+        MAX_BATCH, MAX_WAIT_MS = max_batch, max_wait_ms
+        for key, model in _MODELS.items():
+            old = _BATCHERS[key]
+            _BATCHERS[key] = _Batcher(model, max_batch, max_wait_ms, lock=old._lock)
+            old.close()  # serves what is queued; late callers holding it predict directly
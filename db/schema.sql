@@ -23,6 +23,32 @@ CREATE TABLE IF NOT EXISTS parking_history (
 CREATE INDEX IF NOT EXISTS idx_parking_history_plate_time
   ON parking_history (plate, timestamp DESC);
 
+-- one row per visit; updated in place while the plate keeps being re-seen
+CREATE TABLE IF NOT EXISTS parking_session (
+  id BIGSERIAL PRIMARY KEY,
+  plate VARCHAR(16) REFERENCES car(plate) ON DELETE CASCADE,
+  lot CHAR(1) CHECK (lot IN ('A','B','C')),
+  stall VARCHAR(16),
+  entry_time TIMESTAMP NOT NULL,
+  last_seen TIMESTAMP NOT NULL,
+  exit_time TIMESTAMP,
+  sightings INT DEFAULT 1,
+  best_confidence REAL,
+  image_url TEXT,
+  bbox JSONB,
+  last_sampled_at TIMESTAMP
+);
+
+-- at most one open visit per plate (record_sighting also locks the car row)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_parking_session_open
+  ON parking_session (plate) WHERE exit_time IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_parking_session_plate_entry
+  ON parking_session (plate, entry_time DESC);
+
+CREATE INDEX IF NOT EXISTS idx_parking_session_lot_open
+  ON parking_session (lot, last_seen DESC) WHERE exit_time IS NULL;
+
 CREATE TABLE IF NOT EXISTS ingest_log (
   id BIGSERIAL PRIMARY KEY,
   request_id VARCHAR(64),